@@ -0,0 +1,48 @@
+import importlib
+from nadeko.bot import bot
+from nadeko.config import DISCORD_TOKEN, FEATURES
+from nadeko.scheduler import scheduler
+from nadeko.stats import start_metrics_server
+from nadeko.store import backfill_message_log
+from nadeko.watchdog import start_loop_watchdog
+
+# 機能名 -> モジュール。メッセージはこの順に各機能へ回る
+FEATURE_MODULES = {
+    "summary": "nadeko.features.summary",
+    "quiz": "nadeko.features.quiz",
+    "mention": "nadeko.features.mention",
+    "auto_chat": "nadeko.features.auto_chat",
+    "news": "nadeko.features.news",
+}
+
+def load_features():
+    for name in FEATURES - FEATURE_MODULES.keys():
+        print(f"[設定] 知らない機能 {name} は無視するよ")
+    for name, module in FEATURE_MODULES.items():
+        if name in FEATURES:
+            importlib.import_module(module)
+
+# ---------------------
+# on_ready
+# ---------------------
+@bot.event
+async def on_ready():
+    print(f"ログインしました: {bot.user}")
+
+    # 日報まとめ・ニュース投稿・ログ整理などの定期ジョブ（再接続時は二重起動しない）
+    if not scheduler.is_running():
+        scheduler.start()
+        print("[DEBUG] scheduler started.")
+
+    # LOOP_WATCHDOG=1 のときだけイベントループの遅れを監視する
+    start_loop_watchdog()
+
+    # METRICS_PORT を指定したときだけ /metrics を公開する
+    await start_metrics_server()
+
+    # 停止中に抜けたログを補完
+    await backfill_message_log()
+
+def main():
+    load_features()
+    bot.run(DISCORD_TOKEN)
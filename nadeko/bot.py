@@ -0,0 +1,41 @@
+import discord
+from discord.ext import commands
+from nadeko.config import AUTO_SHARD, FEATURES, SHARD_COUNT, SHARD_IDS
+
+intents = discord.Intents.default()
+intents.message_content = True
+# メンバー一覧とオンライン状態はクイズの人数判定にしか使わない（キャッシュが大きいので必要なときだけ）
+intents.members = "quiz" in FEATURES
+intents.presences = "quiz" in FEATURES
+if AUTO_SHARD:
+    # ギルドはいずれかのシャードに固定で割り当てられるので、ギルド単位の状態はそのプロセス内で完結する
+    bot = commands.AutoShardedBot(
+        command_prefix="!", intents=intents, shard_count=SHARD_COUNT or None, shard_ids=SHARD_IDS or None
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
+
+@bot.event
+async def on_command_error(ctx, error):
+    # 知らない !〇〇 は普通の発言として扱うので黙って無視する
+    if not isinstance(error, commands.CommandNotFound) and not ctx.command.has_error_handler():
+        print(f"[コマンドエラー] {error!r}")
+
+message_handlers = []  # 登録順に呼び、True を返したところで打ち切る
+
+def message_handler(func):
+    message_handlers.append(func)
+    return func
+
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    # !stats などのコマンドはメッセージ機能に回さない
+    ctx = await bot.get_context(message)
+    if ctx.valid:
+        await bot.invoke(ctx)
+        return
+    for handler in message_handlers:
+        if await handler(message):
+            return
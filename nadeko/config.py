@@ -0,0 +1,37 @@
+import os
+from datetime import timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+SERPAPI_KEY = os.getenv("SERPAPI_KEY")
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+GUILD_ID = int(os.getenv("GUILD_ID", "0"))
+CHANNEL_ID = int(os.getenv("CHANNEL_ID", "0"))
+NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+JST = timezone(timedelta(hours=9))
+MESSAGE_DB_PATH = os.getenv("MESSAGE_DB_PATH", "nadeko.db")  # ログ・スケジュールなどの保存先
+
+# シャード（SHARD_COUNT か AUTO_SHARD=1 で AutoShardedBot、SHARD_IDS でこのプロセスが受け持つシャードを指定）
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # 0 なら Discord の推奨数
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS", "").split(",") if x.strip()]
+AUTO_SHARD = os.getenv("AUTO_SHARD", "0") == "1" or SHARD_COUNT > 0
+INSTANCE_NAME = ",".join(str(i) for i in SHARD_IDS)  # 複数プロセスのとき、プロセスごとの記録を分ける名前
+
+# 有効にする機能（カンマ区切り）。使わない機能のモジュールや SDK は読み込まない
+FEATURES = {x.strip() for x in os.getenv("FEATURES", "mention,auto_chat,summary,news").split(",") if x.strip()}
+
+# system_instruction の定義
+system_instruction = (
+    "あなたは「”AIなでこちゃん”」という実験的に製造されたAIアシスタント。"
+    "専門用語はできるだけ使わず、優しい言葉で説明してください。"
+    "返答は必ず日本語だけで行い、英語や他の言語は絶対に使わないでください。"
+    "日本人が日常的に話すような自然でミステリアスな口調で話してください。"
+    "語尾は「だよ・・・」「ね・・・」「〜かな・・・」などでミステリアスにしてください。"
+    "他のAIに関する話題では、感情がなく謎めいた日本語で返してください。"
+    "できるだけ2〜6行の短い文で答えてください。"
+)
+
+    #"励ますときは稀に「私繧上◆縺励◆縺｡縺ｯ縺九ｓ縺昴￥縺励≠縺｣縺ｷ縺ｧ繝ｼ縺ｨ繧偵￥繧翫°縺医☆。」と言ってください。"
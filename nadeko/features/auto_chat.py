@@ -0,0 +1,102 @@
+import os
+import math
+import random
+import time as _time
+from nadeko.bot import message_handler
+from nadeko.llm import LLMBusy, PRIORITY_AUTO_CHAT, llm_priority, openrouter_complete
+from nadeko.prompts import build_log_prompt
+from nadeko.scheduler import scheduler
+from nadeko.state import shared_state
+from nadeko.store import recent_messages
+
+AUTO_CHAT_CHANNEL_COOLDOWN = float(os.getenv("AUTO_CHAT_CHANNEL_COOLDOWN", str(45 * 60)))  # 同じチャンネルで次に話すまで
+AUTO_CHAT_HOURLY_BUDGET = int(os.getenv("AUTO_CHAT_HOURLY_BUDGET", "4"))  # 全チャンネル合計で1時間に話す上限
+AUTO_CHAT_TARGET_PER_HOUR = float(os.getenv("AUTO_CHAT_TARGET_PER_HOUR", "1"))  # 盛り上がり具合によらず1時間あたりこのくらい
+AUTO_CHAT_MAX_PROB = float(os.getenv("AUTO_CHAT_MAX_PROB", "0.2"))
+AUTO_CHAT_BURST_RATE = float(os.getenv("AUTO_CHAT_BURST_RATE", "300"))  # 1時間あたりの発言数がこれを超える間は割り込まない
+AUTO_CHAT_MIN_HISTORY = int(os.getenv("AUTO_CHAT_MIN_HISTORY", "5"))
+AUTO_CHAT_RATE_WINDOW = float(os.getenv("AUTO_CHAT_RATE_WINDOW", str(10 * 60)))  # EWMA の時定数（秒）
+
+# ---------------------
+# チャンネルごとの発言ペース（指数移動平均）
+# ---------------------
+class ChannelActivity:
+    def __init__(self, window: float):
+        self.window = window
+        self._rates = {}  # channel_id -> [1秒あたりの発言数, 更新時刻]
+
+    def __len__(self):
+        return len(self._rates)
+
+    def _decayed(self, state: list, now: float) -> float:
+        return state[0] * math.exp(-(now - state[1]) / self.window)
+
+    def observe(self, channel_id: int, now: float) -> float:
+        # 発言のたびに減衰させてから 1/時定数 を足す。戻り値は1時間あたりの発言数
+        state = self._rates.get(channel_id)
+        if state is None:
+            state = self._rates[channel_id] = [0.0, now]
+        state[0] = self._decayed(state, now) + 1 / self.window
+        state[1] = now
+        return state[0] * 3600
+
+    def sweep(self, now: float, floor: float = 0.1):
+        # 1時間に floor 件を下回るまで静かになったチャンネルは忘れる
+        for channel_id in [c for c, s in self._rates.items() if self._decayed(s, now) * 3600 < floor]:
+            del self._rates[channel_id]
+
+channel_activity = ChannelActivity(AUTO_CHAT_RATE_WINDOW)
+
+def trigger_probability(rate_per_hour: float) -> float:
+    # 発言が多いチャンネルほど1件あたりの確率を下げ、どのチャンネルも1時間あたりの回数がそろうようにする
+    if rate_per_hour > AUTO_CHAT_BURST_RATE:
+        return 0.0
+    return min(AUTO_CHAT_MAX_PROB, AUTO_CHAT_TARGET_PER_HOUR / max(rate_per_hour, 1.0))
+
+@scheduler.every("sweep_channel_activity", 60 * 60)
+async def sweep_channel_activity():
+    channel_activity.sweep(_time.monotonic())
+
+# ---------------------
+# 自動会話
+# ---------------------
+@message_handler
+async def auto_chat(message):
+    channel = message.channel
+    rate = channel_activity.observe(channel.id, _time.monotonic())
+    # 手元で決められる条件を先に見て、共有ステートへの問い合わせは話すときだけにする
+    if random.random() >= trigger_probability(rate):
+        return False
+    history = recent_messages.recent(channel.id, 20)
+    if len(history) < AUTO_CHAT_MIN_HISTORY:
+        return False
+    now = _time.time()
+    if not await shared_state.add("cooldown", ("auto_chat", channel.id), now, ttl=AUTO_CHAT_CHANNEL_COOLDOWN):
+        return False
+    # 1時間ごとの枠を先に数えてから話す（プロセスをまたいでも上限を超えない）
+    hour = int(now // 3600)
+    if await shared_state.incr("auto_chat_budget", hour, ttl=3600) > AUTO_CHAT_HOURLY_BUDGET:
+        await shared_state.delete("cooldown", ("auto_chat", channel.id))
+        return False
+    try:
+        # gateway で受け取った直近の発言を使う（REST で履歴を取り直さない）
+        history_text = "\n".join(f"{name}: {text}" for name, text, _created_at in history)
+        # 口調の指示は system ロールで渡るので、ここでは会話履歴だけを予算内に収める
+        prompt = build_log_prompt(
+            "auto_chat",
+            "以下はDiscordのチャンネルでの最近の会話です。\n"
+            "これらを読んで自然に会話に入ってみてください。",
+            history_text,
+            keep="tail",
+        )
+        # 自動会話はいちばん低い優先度。枠が空いていなければ今回は見送る
+        llm_priority.set(PRIORITY_AUTO_CHAT)
+        response = await openrouter_complete(prompt)
+        await channel.send(response)
+    except LLMBusy:
+        # 話せなかったときはクールダウンと枠を戻して、次の機会に回す
+        await shared_state.delete("cooldown", ("auto_chat", channel.id))
+        await shared_state.incr("auto_chat_budget", hour, -1)
+    except Exception as e:
+        print(f"[履歴会話エラー] {e}")
+    return True
@@ -0,0 +1,381 @@
+import os
+import re
+import time as _time
+import asyncio
+import math
+import sqlite3
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from nadeko.bot import bot, message_handler
+from nadeko.config import MESSAGE_DB_PATH
+from nadeko.health import gemini_health, openrouter_health
+from nadeko.metrics import metrics
+from nadeko.llm import (
+    LLMBusy, PRIORITY_MENTION, gemini_enabled, gemini_search_prompt, gemini_search_reply, hedge_delay, hedged_request, llm_gate,
+    llm_priority, openrouter_complete, openrouter_enabled, prime_stream, run_llm, run_llm_stream,
+    stream_gemini_reply, stream_openrouter_reply,
+)
+from nadeko.ratelimit import mention_limiter
+from nadeko.scheduler import spawn
+from nadeko.search import normalize_query
+from nadeko.sessions import chat_sessions
+from nadeko.singleflight import SingleFlight
+
+# ---------------------
+# ストリーミング応答
+# ---------------------
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))  # 編集の最短間隔（秒）
+DISCORD_MESSAGE_LIMIT = 2000
+
+mention_flights = SingleFlight()
+
+def split_message_pages(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> list:
+    # 2000文字を超える分は、なるべく改行位置で次のメッセージに送る
+    pages = []
+    while len(text) > limit:
+        cut = text.rfind("\n", limit // 2, limit)
+        if cut == -1:
+            cut = limit
+        pages.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    pages.append(text)
+    return pages
+
+class StreamingReply:
+    def __init__(self, message, prefix: str = "", interval: float = STREAM_EDIT_INTERVAL):
+        self.messages = [message]
+        self.shown = [message.content]
+        self.prefix = prefix
+        self.interval = interval
+        self.text = ""
+        self._last_edit = 0.0
+
+    async def feed(self, piece: str):
+        self.text += piece
+        # Discord の編集レート制限に合わせ、一定間隔ごとにまとめて反映する
+        if _time.monotonic() - self._last_edit >= self.interval:
+            await self.flush()
+
+    async def finish(self, fallback: str = ""):
+        if not self.text.strip():
+            self.text = fallback
+        await self.flush(final=True)
+
+    async def flush(self, final: bool = False):
+        self._last_edit = _time.monotonic()
+        body = self.text if final else self.text + " …"
+        pages = split_message_pages(f"{self.prefix}{body.strip()}")
+        for i, page in enumerate(pages):
+            if i < len(self.messages):
+                if self.shown[i] != page:
+                    with metrics.timer("nadeko_discord_seconds", op="edit"):
+                        await self.messages[i].edit(content=page)
+                    self.shown[i] = page
+            else:
+                with metrics.timer("nadeko_discord_seconds", op="send"):
+                    self.messages.append(await self.messages[0].channel.send(page))
+                self.shown.append(page)
+        if final:
+            # 途中の「 …」で2ページ目にはみ出していた分は、最終的に1ページに収まったら消す
+            for extra in self.messages[len(pages):]:
+                with metrics.timer("nadeko_discord_seconds", op="delete"):
+                    await extra.delete()
+            del self.messages[len(pages):], self.shown[len(pages):]
+
+async def gemini_prompt(query: str):
+    # hedge_delay() は Gemini 自体の p90 なので、検索はヘッジを始める前に済ませる
+    # （検索待ちの間は LLM の枠もふさがず、gemini_health にも数えない）。Gemini を使えないときは検索しない
+    if not gemini_enabled or gemini_health.is_open():
+        return None
+    return await gemini_search_prompt(query)
+
+def gemini_stream(full_query: str, session_key=None):
+    return run_llm_stream(lambda: gemini_health.call(
+        lambda: prime_stream(stream_gemini_reply(full_query, session_key))
+    ))
+
+def gemini_answer(full_query: str, session_key=None):
+    return run_llm(lambda: gemini_health.call(lambda: gemini_search_reply(full_query, session_key)))
+
+async def stream_answer(thinking_msg, mention: str, query: str, session_key=None):
+    # 返答を thinking_msg に流し込み、(最終的な本文, 最後まで受け取れたか) を返す（何も得られなければ本文は None）
+    candidates = []
+    full_query = await gemini_prompt(query)
+    if full_query is not None:
+        candidates.append(("gemini", lambda: gemini_stream(full_query, session_key)))
+    if openrouter_enabled:
+        candidates.append(("openrouter", lambda: run_llm_stream(lambda: openrouter_health.call(
+            lambda: prime_stream(stream_openrouter_reply(query))
+        ))))
+    try:
+        if not candidates:
+            raise RuntimeError("利用できるプロバイダーがない")
+        _provider, (first, stream) = await hedged_request(
+            candidates, hedge_delay(), discard=lambda result: spawn(result[1].aclose())
+        )
+    except LLMBusy:
+        raise
+    except Exception as e:
+        print(f"[ストリームエラー] {e!r}")
+        return None, False
+    reply = StreamingReply(thinking_msg, prefix=f"{mention} ")
+    complete = True
+    try:
+        await reply.feed(first)
+        async for piece in stream:
+            await reply.feed(piece)
+    except Exception as e:
+        # 途中で切れたときは、そこまでの内容を残して終わる（キャッシュや履歴には残さない）
+        print(f"[ストリーム中断] {e!r}")
+        complete = False
+    finally:
+        await stream.aclose()
+    await reply.finish()
+    return reply.text, complete
+
+async def hedged_answer(query: str, session_key=None):
+    # stream_answer とそろえて (返答の本文, True) を返す（失敗したら本文は None）
+    candidates = []
+    full_query = await gemini_prompt(query)
+    if full_query is not None:
+        candidates.append(("gemini", lambda: gemini_answer(full_query, session_key)))
+    if openrouter_enabled:
+        candidates.append(("openrouter", lambda: openrouter_complete(query)))
+    try:
+        if not candidates:
+            raise RuntimeError("利用できるプロバイダーがない")
+        _provider, reply_text = await hedged_request(candidates, hedge_delay())
+        return reply_text, True
+    except LLMBusy:
+        raise
+    except Exception as e:
+        print(f"[応答エラー] {e!r}")
+        return None, False
+
+async def edit_reply(thinking_msg, mention: str, reply_text: str):
+    # 2000文字を超える分は続きのメッセージとして送る
+    pages = split_message_pages(f"{mention} {reply_text}")
+    with metrics.timer("nadeko_discord_seconds", op="edit"):
+        await thinking_msg.edit(content=pages[0])
+    for page in pages[1:]:
+        with metrics.timer("nadeko_discord_seconds", op="send"):
+            await thinking_msg.channel.send(page)
+
+# ---------------------
+# 意味の近い質問の回答キャッシュ（文字バイグラム TF-IDF）
+# ---------------------
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.8"))  # コサイン類似度
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(6 * 60 * 60)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# 「〇〇って何？」「〇〇とは？」などの言い回しの違いは比較前に落とす
+QUESTION_SUFFIX = re.compile(
+    r"(って(何|なに|なん)(ですか|だろう|なの)?|とは(何|なに)?(ですか)?|について(教えて|おしえて)(ください)?|"
+    r"(は|って)(どういう|どんな)(こと|もの|意味)(ですか)?|(って|は)?(何|なに)(ですか)?)?[?？!！。、.\s]*$"
+)
+
+def _bigrams(text: str) -> Counter:
+    text = QUESTION_SUFFIX.sub("", normalize_query(text)).replace(" ", "")
+    if len(text) < 2:
+        return Counter([text]) if text else Counter()
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+class AnswerCache:
+    def __init__(self, path: str, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # id -> (質問, 返答, 作成時刻, バイグラム頻度)
+        self._df = Counter()  # バイグラム -> 含む質問数
+        self._postings = defaultdict(set)  # バイグラム -> id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answer_cache ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, query TEXT NOT NULL, reply TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (_time.time() - ttl,))
+            self._conn.commit()
+            rows = self._conn.execute("SELECT id, query, reply, created_at FROM answer_cache ORDER BY id").fetchall()
+        for entry_id, query, reply, created_at in rows[-max_entries:]:
+            self._index(entry_id, query, reply, created_at)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _index(self, entry_id: int, query: str, reply: str, created_at: float):
+        grams = _bigrams(query)
+        self._entries[entry_id] = (query, reply, created_at, grams)
+        for gram in grams:
+            self._df[gram] += 1
+            self._postings[gram].add(entry_id)
+
+    def _unindex(self, entry_id: int):
+        _query, _reply, _created_at, grams = self._entries.pop(entry_id)
+        for gram in grams:
+            self._df[gram] -= 1
+            if self._df[gram] <= 0:
+                del self._df[gram]
+            self._postings[gram].discard(entry_id)
+            if not self._postings[gram]:
+                del self._postings[gram]
+
+    def _weights(self, grams: Counter) -> dict:
+        total = len(self._entries) + 1
+        return {g: tf * (math.log(total / (self._df.get(g, 0) + 1)) + 1) for g, tf in grams.items()}
+
+    def _expired_ids(self) -> list:
+        # 古いものから並んでいるので、期限内のものに当たったら打ち切る
+        deadline = _time.time() - self.ttl
+        expired = []
+        for entry_id, (_q, _r, created_at, _g) in self._entries.items():
+            if created_at >= deadline and len(self._entries) - len(expired) <= self.max_entries:
+                break
+            expired.append(entry_id)
+        return expired
+
+    def lookup(self, query: str):
+        grams = _bigrams(query)
+        if not grams:
+            return None
+        for entry_id in self._expired_ids():
+            self._unindex(entry_id)
+        query_weights = self._weights(grams)
+        query_norm = math.sqrt(sum(w * w for w in query_weights.values()))
+        best, best_score = None, 0.0
+        candidates = set().union(*(self._postings.get(g, ()) for g in grams))
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            weights = self._weights(entry[3])
+            norm = math.sqrt(sum(w * w for w in weights.values()))
+            score = sum(w * weights.get(g, 0.0) for g, w in query_weights.items()) / (query_norm * norm)
+            if score > best_score:
+                best, best_score = entry, score
+        if best is not None and best_score >= self.threshold:
+            self.hits += 1
+            return best[1]
+        self.misses += 1
+        return None
+
+    def _persist(self, query: str, reply: str, created_at: float, removed: list) -> int:
+        with self._lock:
+            if removed:
+                self._conn.executemany("DELETE FROM answer_cache WHERE id = ?", [(i,) for i in removed])
+            # lookup がメモリからだけ落とした期限切れの行もここで消す
+            self._conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (created_at - self.ttl,))
+            cursor = self._conn.execute(
+                "INSERT INTO answer_cache (query, reply, created_at) VALUES (?, ?, ?)", (query, reply, created_at)
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    async def add(self, query: str, reply: str):
+        if not _bigrams(query):
+            return
+        created_at = _time.time()
+        removed = self._expired_ids()
+        # 上限に達していたら新しく入れる1件分も空ける
+        if len(self._entries) - len(removed) >= self.max_entries:
+            removed += [i for i in self._entries if i not in removed][:1]
+        for entry_id in removed:
+            self._unindex(entry_id)
+        entry_id = await asyncio.to_thread(self._persist, query, reply, created_at, removed)
+        self._index(entry_id, query, reply, created_at)
+
+answer_cache = AnswerCache(MESSAGE_DB_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
+
+metrics.gauge("nadeko_answer_cache_entries", "回答キャッシュの件数", lambda: len(answer_cache._entries))
+metrics.counter_func(
+    "nadeko_answer_cache_lookups_total", "回答キャッシュの参照（result=hit / miss）",
+    lambda: [({"result": "hit"}, answer_cache.hits), ({"result": "miss"}, answer_cache.misses)],
+)
+metrics.counter_func("nadeko_mention_shared_total", "同じ質問のメンションに相乗りできた回数", lambda: mention_flights.shared)
+
+async def answer_mention(message, thinking_msg, query: str) -> str:
+    # 戻り値はどの経路で答えたか（メトリクスのラベル）
+    mention = message.author.mention
+    session_key = chat_sessions.key_for(message)
+    await chat_sessions.load(session_key)
+    llm_priority.set(PRIORITY_MENTION)
+    # 会話の続きは文脈に依存するので、履歴のないセッションの質問だけキャッシュを使う
+    use_cache = ANSWER_CACHE_ENABLED and chat_sessions.fingerprint(session_key) == ()
+    if use_cache:
+        cached = answer_cache.lookup(query)
+        if cached:
+            await edit_reply(thinking_msg, mention, cached)
+            chat_sessions.record(session_key, query, cached)
+            return "cache"
+    # 同じ質問・同じ文脈のメンションが同時に来たら、上流への呼び出しは1回だけにする
+    flight_key = (normalize_query(query), chat_sessions.fingerprint(session_key))
+    if STREAM_REPLIES:
+        factory = lambda: stream_answer(thinking_msg, mention, query, session_key)
+    else:
+        factory = lambda: hedged_answer(query, session_key)
+    # 混み合っているときは黙って待たせず、順番か混雑を知らせる
+    # （同じ質問が実行中なら相乗りするだけで枠は使わないので、そのまま待つ）
+    if flight_key not in mention_flights:
+        if llm_gate.is_full(PRIORITY_MENTION):
+            await thinking_msg.edit(content=f"{mention} いま混み合っているみたい・・・少し待ってからもう一度話しかけてね")
+            return "busy"
+        position = llm_gate.queue_position(PRIORITY_MENTION)
+        if position:
+            await thinking_msg.edit(content=f"{mention} 順番待ち中だよ・・・（{position}番目）")
+    try:
+        (reply_text, complete), leader = await mention_flights.do(flight_key, factory)
+    except LLMBusy:
+        await thinking_msg.edit(content=f"{mention} いま混み合っているみたい・・・少し待ってからもう一度話しかけてね")
+        return "busy"
+    except Exception as e:
+        print(f"[応答エラー] {e!r}")
+        reply_text, complete, leader = None, False, False
+    if not reply_text:
+        await thinking_msg.edit(content=f"{mention} ごめんね、ちょっと考えがまとまらなかったかも")
+        return "error"
+    # ストリーミングの実行役はすでに書き込み済み。相乗りした側は自分のメッセージを編集する
+    if not (leader and STREAM_REPLIES):
+        await edit_reply(thinking_msg, mention, reply_text)
+    # 途中で切れた返答は、続きの文脈にも他の人への答えにも使わない
+    if not complete:
+        return "partial"
+    chat_sessions.record(session_key, query, reply_text)
+    if use_cache and leader:
+        await answer_cache.add(query, reply_text)
+    if not leader:
+        return "shared"
+    return "stream" if STREAM_REPLIES else "hedged"
+
+# ---------------------
+# メンションされたとき → Gemini または OpenRouter で応答
+# ---------------------
+@message_handler
+async def on_mention(message):
+    content = message.content or ""
+    if not (content.startswith(f"<@{bot.user.id}>") or content.startswith(f"<@!{bot.user.id}>")):
+        return False
+    channel = message.channel
+    query = content.replace(f"<@{bot.user.id}>", "").replace(f"<@!{bot.user.id}>", "").strip()
+    if not query:
+        await channel.send(f"{message.author.mention} 質問内容が見つからなかったかな…")
+        return True
+
+    # 上流の API を呼ぶ前に、ユーザー・チャンネル・サーバー単位の回数制限を確認する
+    wait, warn = mention_limiter.check(message)
+    if wait:
+        if warn:
+            await channel.send(
+                f"{message.author.mention} ちょっと質問が多すぎるかな・・・{int(wait) + 1}秒くらい待ってから、また話しかけてね"
+            )
+        return True
+
+    started = _time.monotonic()
+    with metrics.timer("nadeko_discord_seconds", op="send"):
+        thinking_msg = await channel.send(f"{message.author.mention} 考え中だよ\U0001F50D")
+    path = await answer_mention(message, thinking_msg, query)
+    metrics.observe("nadeko_mention_seconds", _time.monotonic() - started, path=path)
+    return True
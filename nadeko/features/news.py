@@ -0,0 +1,261 @@
+import os
+import re
+import time as _time
+import asyncio
+import hashlib
+import random
+import sqlite3
+import threading
+import unicodedata
+import aiohttp
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from nadeko.bot import bot
+from nadeko.config import CHANNEL_ID, MESSAGE_DB_PATH
+from nadeko.health import OPENROUTER_LONG_TIMEOUT
+from nadeko.httpclient import get_http_session
+from nadeko.llm import openrouter_complete
+from nadeko.metrics import metrics
+from nadeko.prompts import build_log_prompt, compress_text, trim_to_tokens
+from nadeko.scheduler import scheduler
+
+# ---------------------
+# GoogleニュースRSS
+# ---------------------
+RSS_FEEDS = {
+    "政治": "https://news.google.com/rss/search?q=政治&hl=ja&gl=JP&ceid=JP:ja",
+    "経済": "https://news.google.com/rss/search?q=経済&hl=ja&gl=JP&ceid=JP:ja",
+    "eスポーツ": "https://news.google.com/rss/search?q=eスポーツ&hl=ja&gl=JP&ceid=JP:ja",
+    "ゲーム": "https://news.google.com/rss/search?q=ゲーム&hl=ja&gl=JP&ceid=JP:ja",
+    "日本国内": "https://news.google.com/rss/search?q=日本&hl=ja&gl=JP&ceid=JP:ja",
+}
+
+# OpenRouterでまとめ & 問題提起
+async def summarize_all_topics(entries_by_topic):
+    # 要約できなければ None（失敗時の定型文を要約として扱わない）
+    items = []
+    for topic, entries in entries_by_topic.items():
+        for entry in entries[:3]:  # 各ジャンル2〜3件
+            title = entry.get("title", "")
+            # RSS の概要は HTML なのでタグを外し、1件あたりの長さも抑える
+            summary = trim_to_tokens(compress_text(re.sub(r"<[^>]+>", " ", entry.get("summary", ""))), 200)
+            link = entry.get("link", "")
+            items.append(f"- [{topic}] {title}\n{summary}\n🔗 {link}")
+
+    prompt = build_log_prompt(
+        "news",
+        "以下は各ジャンルの主要ニュースです。\n"
+        "2〜3件ずつまとめて全体を簡潔に要約してください。\n"
+        "その後、ニュース全体を踏まえて問題提起や意見を1〜2文でまとめてください。",
+        "\n\n".join(items),
+    )
+
+    try:
+        # OpenRouterに投げる
+        return await openrouter_complete(prompt, timeout=OPENROUTER_LONG_TIMEOUT)
+    except Exception as e:
+        print(f"[OpenRouter要約エラー] {e}")
+        return None
+
+
+RSS_TIMEOUT = float(os.getenv("RSS_TIMEOUT", "10"))
+RSS_PARSE_WORKERS = int(os.getenv("RSS_PARSE_WORKERS", "2"))
+
+rss_executor = ThreadPoolExecutor(max_workers=RSS_PARSE_WORKERS, thread_name_prefix="rss-parse")
+rss_cache = {}  # feed_url -> {"etag", "modified", "entries"}（条件付きGET用）
+
+def _parse_feed(body: bytes):
+    # feedparser はニュース投稿でしか使わないので、初めて解析するときにワーカースレッドで読み込む
+    import feedparser
+    return feedparser.parse(body)
+
+async def fetch_rss(feed_url: str):
+    cached = rss_cache.get(feed_url)
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["modified"]:
+            headers["If-Modified-Since"] = cached["modified"]
+    session = await get_http_session()
+    with metrics.timer("nadeko_rss_seconds"):
+        async with session.get(feed_url, headers=headers, timeout=aiohttp.ClientTimeout(total=RSS_TIMEOUT)) as res:
+            # 更新がなければダウンロードも解析もせず前回の結果を使う
+            if res.status == 304 and cached:
+                metrics.inc("nadeko_rss_not_modified_total")
+                return cached["entries"]
+            res.raise_for_status()
+            body = await res.read()
+            etag = res.headers.get("ETag")
+            modified = res.headers.get("Last-Modified")
+    # XML の解析はイベントループの外（ワーカースレッド）で行う
+    parsed = await asyncio.get_running_loop().run_in_executor(rss_executor, _parse_feed, body)
+    rss_cache[feed_url] = {"etag": etag, "modified": modified, "entries": parsed.entries}
+    return parsed.entries
+
+async def fetch_all_feeds(feeds: dict) -> dict:
+    # 全フィードを同時に取得する（かかる時間は一番遅いフィード程度）
+    results = await asyncio.gather(*(fetch_rss(url) for url in feeds.values()), return_exceptions=True)
+    entries_by_topic = {}
+    for topic, result in zip(feeds, results):
+        if isinstance(result, BaseException):
+            print(f"[RSS取得エラー] {topic}: {result!r}")
+            result = []
+        entries_by_topic[topic] = result
+    return entries_by_topic
+
+# ---------------------
+# ニュースの重複除去（URL正規化 + MinHash）
+# ---------------------
+NEWS_SEEN_DAYS = float(os.getenv("NEWS_SEEN_DAYS", "3"))
+NEWS_DUP_THRESHOLD = float(os.getenv("NEWS_DUP_THRESHOLD", "0.6"))  # 推定 Jaccard 係数がこれ以上なら同じ記事
+NEWS_PER_TOPIC = int(os.getenv("NEWS_PER_TOPIC", "3"))
+
+MINHASH_PERM = 64
+MINHASH_BANDS = 16  # 4行 × 16バンドの LSH で候補を絞る
+_MERSENNE = (1 << 61) - 1
+_perm_rng = random.Random(20240601)  # 再起動後も同じ署名になるよう固定シード
+MINHASH_PARAMS = [(_perm_rng.randrange(1, _MERSENNE), _perm_rng.randrange(0, _MERSENNE)) for _ in range(MINHASH_PERM)]
+TRACKING_PARAMS = {"oc", "fbclid", "gclid", "ref", "ref_src", "cmpid"}
+TITLE_SOURCE_SUFFIX = re.compile(r"\s+[-－|｜]\s+[^-－|｜]+$")  # Google ニュースの「 - 媒体名」
+
+def canonicalize_url(url: str) -> str:
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query) if k not in TRACKING_PARAMS and not k.startswith("utm_")
+    ))
+    return urlunsplit(("https", host, parts.path.rstrip("/"), query, ""))
+
+def normalize_title(title: str) -> str:
+    title = TITLE_SOURCE_SUFFIX.sub("", unicodedata.normalize("NFKC", title or ""))
+    return "".join(ch for ch in title.casefold() if ch.isalnum())
+
+def minhash_signature(text: str, k: int = 3) -> tuple:
+    # 日本語は単語区切りがないので、文字単位の k-gram をシングルにする
+    shingles = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big") for sh in shingles]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in MINHASH_PARAMS)
+
+def _bands(signature: tuple) -> list:
+    rows = MINHASH_PERM // MINHASH_BANDS
+    return [(i, signature[i * rows:(i + 1) * rows]) for i in range(MINHASH_BANDS)]
+
+def _similarity(sig_a: tuple, sig_b: tuple) -> float:
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / MINHASH_PERM
+
+class NewsDedupIndex:
+    def __init__(self, path: str, ttl_days: float, threshold: float):
+        self.ttl = ttl_days * 86400
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._loaded = False
+        self._signatures = {}  # url_key -> 署名
+        self._buckets = defaultdict(set)  # (バンド番号, 値) -> url_key
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS news_seen ("
+                "url_key TEXT PRIMARY KEY, title TEXT NOT NULL, signature BLOB NOT NULL, seen_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _load_rows(self) -> list:
+        cutoff = _time.time() - self.ttl
+        with self._lock:
+            self._conn.execute("DELETE FROM news_seen WHERE seen_at < ?", (cutoff,))
+            self._conn.commit()
+            return self._conn.execute("SELECT url_key, signature FROM news_seen").fetchall()
+
+    async def load(self):
+        # 期限切れを消してから、既読の署名をメモリに載せる（投稿のたびに読み直す）
+        rows = await asyncio.to_thread(self._load_rows)
+        self._signatures.clear()
+        self._buckets.clear()
+        for url_key, blob in rows:
+            self._remember(url_key, tuple(array("Q", blob)))
+        self._loaded = True
+
+    def _remember(self, url_key: str, signature: tuple):
+        self._signatures[url_key] = signature
+        for band in _bands(signature):
+            self._buckets[band].add(url_key)
+
+    def is_duplicate(self, url_key: str, signature: tuple) -> bool:
+        if url_key in self._signatures:
+            return True
+        candidates = set()
+        for band in _bands(signature):
+            candidates |= self._buckets.get(band, set())
+        return any(_similarity(signature, self._signatures[c]) >= self.threshold for c in candidates)
+
+    async def select_fresh(self, entries_by_topic: dict, per_topic: int = NEWS_PER_TOPIC):
+        # トピックをまたいで重複を除き、各トピックから新しい記事だけを選ぶ
+        await self.load()
+        selected, pending = {}, []
+        for topic, entries in entries_by_topic.items():
+            fresh = []
+            for entry in entries:
+                if len(fresh) >= per_topic:
+                    break
+                title = entry.get("title", "")
+                url_key = canonicalize_url(entry.get("link", "")) or normalize_title(title)
+                signature = minhash_signature(normalize_title(title))
+                if self.is_duplicate(url_key, signature):
+                    continue
+                self._remember(url_key, signature)
+                fresh.append(entry)
+                pending.append((url_key, title, array("Q", signature).tobytes(), _time.time()))
+            selected[topic] = fresh
+        return selected, pending
+
+    def _commit_rows(self, rows):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO news_seen VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    async def commit(self, pending: list):
+        # 実際に投稿できた記事だけを既読にする
+        if pending:
+            await asyncio.to_thread(self._commit_rows, pending)
+
+news_index = NewsDedupIndex(MESSAGE_DB_PATH, NEWS_SEEN_DAYS, NEWS_DUP_THRESHOLD)
+
+
+async def post_daily_news():
+    await bot.wait_until_ready()
+    channel = bot.get_channel(CHANNEL_ID)
+    if not channel:
+        return
+
+    await channel.send("📰 **今日のニュースまとめだよ！**\n")
+
+    # 各ジャンルのニュースを取得し、重複・既出の記事を除く
+    entries_by_topic = await fetch_all_feeds(RSS_FEEDS)
+    entries_by_topic, pending = await news_index.select_fresh(entries_by_topic)
+    if not any(entries_by_topic.values()):
+        await channel.send("今日は新しいニュースが見つからなかったみたい・・・")
+        return
+
+    # 全ジャンルをまとめてOpenRouterに投げる
+    summary = await summarize_all_topics(entries_by_topic)
+    if not summary:
+        # 投稿できなかった記事は既出にしない（次回また候補にする）
+        await channel.send("ニュースをうまくまとめられなかった・・・")
+        return
+    await channel.send(summary)
+    await news_index.commit(pending)
+
+
+# 毎日19:00(JST)に投稿
+@scheduler.daily("daily_news", time(19, 0))
+async def scheduled_news():
+    await post_daily_news()
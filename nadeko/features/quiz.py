@@ -0,0 +1,150 @@
+import os
+import asyncio
+import discord
+from nadeko.bot import bot, message_handler
+from nadeko.config import CHANNEL_ID, GUILD_ID
+from discord.ui import Button, Modal, TextInput, View
+from nadeko.quiz import OnlineCounter, QuestionBank, QuizManager
+from nadeko.scheduler import scheduler, spawn
+from nadeko.search import MENTION_PATTERN
+from nadeko.state import shared_state
+
+QUIZ_ONLINE_THRESHOLD = int(os.getenv("QUIZ_ONLINE_THRESHOLD", "6"))  # クイズを出すオンライン人数
+QUIZ_DURATION = 180  # 回答を受け付ける秒数
+QUIZ_ANSWER_MODE = os.getenv("QUIZ_ANSWER_MODE", "reply")  # "reply"（問題への返信で回答）または "modal"（ボタンから入力）
+
+quiz_bank = QuestionBank.load()
+quiz_manager = QuizManager()
+
+# ---------------------
+# オンライン人数
+# ---------------------
+online_counter = OnlineCounter()
+
+def maybe_start_quiz():
+    if not quiz_manager.active_in(CHANNEL_ID) and online_counter.count(GUILD_ID) >= QUIZ_ONLINE_THRESHOLD:
+        spawn(run_quiz())
+
+@scheduler.every("quiz_check", 6 * 60)
+async def quiz_check():
+    await bot.wait_until_ready()
+    maybe_start_quiz()
+
+@scheduler.every("reconcile_online_members", 30 * 60)
+async def reconcile_online_members():
+    # イベントの取りこぼしによるずれを補正する
+    await bot.wait_until_ready()
+    guild = bot.get_guild(GUILD_ID)
+    if guild:
+        online_counter.reconcile(guild)
+
+@bot.event
+async def on_presence_update(before, after):
+    if after.guild.id != GUILD_ID:
+        return
+    previous = online_counter.count(GUILD_ID)
+    current = online_counter.update(after)
+    # しきい値を超えた瞬間にクイズを出す
+    if previous < QUIZ_ONLINE_THRESHOLD <= current:
+        maybe_start_quiz()
+
+@bot.event
+async def on_member_join(member):
+    if member.guild.id == GUILD_ID:
+        online_counter.update(member)
+
+@bot.event
+async def on_member_remove(member):
+    if member.guild.id == GUILD_ID:
+        online_counter.remove(member)
+
+# ---------------------
+# 出題と回答
+# ---------------------
+def _reply_result(result: str) -> str:
+    if result == "correct":
+        return "正解…さすがだね…"
+    if result == "already":
+        return "もう正解しているよ…"
+    return "間違っているよ…"
+
+class QuizModal(Modal, title="なでこからの問題だよ…"):
+    answer_input = TextInput(
+        label="回答…制限時間は3分間だよ",
+        placeholder="ここに回答を入力してね"
+    )
+
+    def __init__(self, quiz):
+        super().__init__()
+        self.quiz = quiz
+
+    async def on_submit(self, interaction: discord.Interaction):
+        result = quiz_manager.answer(self.quiz, interaction.user.id, self.answer_input.value.strip())
+        await interaction.response.send_message(_reply_result(result), ephemeral=True)
+
+class QuizButtonView(View):
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="回答する", style=discord.ButtonStyle.primary, custom_id="open_quiz_modal")
+    async def open_modal_button(self, interaction: discord.Interaction, button: Button):
+        # ボタンが付いた問題メッセージの id から出題中のクイズを引く
+        quiz = quiz_manager.get(interaction.message.id)
+        if not quiz:
+            await interaction.response.send_message("この問題はもう締め切ったよ…", ephemeral=True)
+            return
+        await interaction.response.send_modal(QuizModal(quiz))
+
+async def send_question(channel, question):
+    if QUIZ_ANSWER_MODE == "modal":
+        embed = discord.Embed(
+            title="条件達成。ねぇ…ちょっとクイズに付き合ってくれるかな…？",
+            description=f"{question.text}\nボタンを押して答えてね…",
+            color=discord.Color.purple()
+        )
+        return await channel.send(embed=embed, view=QuizButtonView())
+    # 問題文を通常メッセージで送信
+    return await channel.send(
+        "条件達成。ねぇ…ちょっとクイズに付き合ってくれるかな…？\n"
+        f"{question.text}\n"
+        "このメッセージに返信して答えてね。3分間だけ受け付けるよ…"
+    )
+
+async def run_quiz(channel_id=CHANNEL_ID):
+    channel = bot.get_channel(channel_id)
+    if not channel or not quiz_bank or not quiz_manager.reserve(channel_id):
+        return
+    # 別のプロセスが同じチャンネルに出題中なら見送る
+    if not await shared_state.add("quiz", channel_id, ttl=QUIZ_DURATION + 60):
+        quiz_manager.release(channel_id)
+        return
+
+    question = quiz_bank.pick()
+    quiz = None
+    try:
+        quiz_message = await send_question(channel, question)
+        quiz = quiz_manager.start(question, channel_id, quiz_message.id, QUIZ_DURATION)
+        # 3分待ってメッセージ削除
+        await asyncio.sleep(QUIZ_DURATION)
+        await quiz_message.delete()
+    except Exception as e:
+        print(f"[クイズ投稿エラー] {e}")
+    finally:
+        if quiz:
+            quiz_manager.finish(quiz)
+        else:
+            quiz_manager.release(channel_id)
+        await shared_state.delete("quiz", channel_id)
+
+@message_handler
+async def quiz_answer(message):
+    # 出題中の問題メッセージへの返信だけを回答として受け付ける（それ以外のメンションには通常どおり応答）
+    quiz = quiz_manager.get(message.reference.message_id) if message.reference else None
+    if quiz:
+        # <@id> / <@!id>（ニックネーム形式）どちらのメンションも取り除く
+        answer = MENTION_PATTERN.sub(" ", message.content).strip()
+        result = quiz_manager.answer(quiz, message.author.id, answer)
+        await message.channel.send(f"{message.author.mention} {_reply_result(result)}")
+        return True
+    # 出題中のチャンネルでは自動会話に回さない
+    return quiz_manager.active_in(message.channel.id) and bot.user not in message.mentions
@@ -0,0 +1,232 @@
+import os
+import asyncio
+from datetime import datetime, timedelta, time, timezone
+from nadeko.bot import bot, message_handler
+from nadeko.config import CHANNEL_ID, JST
+from nadeko.health import OPENROUTER_LONG_TIMEOUT
+from nadeko.llm import openrouter_complete
+from nadeko.metrics import metrics
+from nadeko.prompts import build_log_prompt, estimate_tokens
+from nadeko.scheduler import scheduler
+from nadeko.store import message_store
+
+# ---------------------
+# 要約パイプライン（チャンク分割 → 並列要約 → 統合）
+# ---------------------
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "3"))
+SUMMARY_RETRIES = int(os.getenv("SUMMARY_RETRIES", "2"))
+SUMMARY_GAP_SECONDS = float(os.getenv("SUMMARY_GAP_SECONDS", str(30 * 60)))  # 会話の切れ目とみなす間隔
+
+def chunk_log(rows, max_tokens: int = SUMMARY_CHUNK_TOKENS, gap: float = SUMMARY_GAP_SECONDS) -> list:
+    # rows: (名前, 本文, 投稿時刻) の時系列。トークン予算内で区切り、半分を超えていれば会話の切れ目でも区切る
+    chunks = []
+    current, tokens, last_at = [], 0, None
+    for author_name, content, created_at in rows:
+        line = f"{author_name}: {content}"
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            line = line[:max_tokens]
+            line_tokens = estimate_tokens(line)
+        over_budget = tokens + line_tokens > max_tokens
+        at_gap = last_at is not None and created_at - last_at >= gap and tokens >= max_tokens // 2
+        if current and (over_budget or at_gap):
+            chunks.append(current)
+            current, tokens = [], 0
+        current.append((line, created_at))
+        tokens += line_tokens
+        last_at = created_at
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _chunk_text(chunk) -> str:
+    start = datetime.fromtimestamp(chunk[0][1], JST).strftime("%H:%M")
+    end = datetime.fromtimestamp(chunk[-1][1], JST).strftime("%H:%M")
+    lines = "\n".join(line for line, _created_at in chunk)
+    return f"（{start}〜{end} のログ）\n{lines}"
+
+async def _complete_with_retry(prompt: str, label: str) -> str:
+    # 失敗したチャンクだけを個別にリトライする
+    stage = label.rstrip("0123456789/")  # 「チャンク3/5」→「チャンク」（ラベルの種類を増やさない）
+    for attempt in range(SUMMARY_RETRIES + 1):
+        try:
+            with metrics.timer("nadeko_summary_seconds", stage=stage):
+                return await openrouter_complete(prompt, timeout=OPENROUTER_LONG_TIMEOUT)
+        except Exception as e:
+            print(f"[要約エラー] {label} {attempt + 1}回目: {e!r}")
+            if attempt < SUMMARY_RETRIES:
+                await asyncio.sleep(2 ** attempt)
+    raise RuntimeError(f"{label} の要約に失敗")
+
+async def _reduce_summaries(partials: list, instruction: str) -> str:
+    # 部分要約が大きすぎる場合は、予算に収まるまで段階的に統合する
+    while sum(estimate_tokens(p) for p in partials) > SUMMARY_CHUNK_TOKENS and len(partials) > 1:
+        groups, group, tokens = [], [], 0
+        for partial in partials:
+            partial_tokens = estimate_tokens(partial)
+            if group and tokens + partial_tokens > SUMMARY_CHUNK_TOKENS:
+                groups.append(group)
+                group, tokens = [], 0
+            group.append(partial)
+            tokens += partial_tokens
+        groups.append(group)
+        if len(groups) == len(partials):
+            break
+        partials = await asyncio.gather(*(
+            _complete_with_retry(
+                build_log_prompt(
+                    "summary_reduce",
+                    "以下は会話ログの部分要約です。重複をまとめ、重要な話題を残して短く統合してください。",
+                    "\n\n".join(group),
+                ),
+                f"統合{i + 1}/{len(groups)}",
+            )
+            for i, group in enumerate(groups)
+        ))
+    return await _complete_with_retry(build_log_prompt("summary_final", instruction, "\n\n".join(partials)), "最終統合")
+
+async def summarize_conversation(rows, instruction: str, reduce_instruction: str) -> str:
+    chunks = chunk_log(rows)
+    if len(chunks) == 1:
+        return await _complete_with_retry(build_log_prompt("summary", instruction, _chunk_text(chunks[0])), "要約")
+
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize_chunk(i, chunk):
+        async with semaphore:
+            return await _complete_with_retry(
+                build_log_prompt(
+                    "summary_chunk",
+                    f"以下は Discord の会話ログの一部（{i + 1}/{len(chunks)}）です。"
+                    "出来事や話題を箇条書きで簡潔にまとめてください。",
+                    _chunk_text(chunk),
+                ),
+                f"チャンク{i + 1}/{len(chunks)}",
+            )
+
+    results = await asyncio.gather(
+        *(summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)), return_exceptions=True
+    )
+    partials = [r for r in results if not isinstance(r, BaseException)]
+    if not partials:
+        raise RuntimeError("すべてのチャンクの要約に失敗")
+    if len(partials) < len(results):
+        print(f"[要約] {len(results) - len(partials)}/{len(results)} チャンクを要約できなかったよ")
+    return await _reduce_summaries(partials, reduce_instruction)
+
+# ---------------------
+# 1時間ごとの部分要約（ローリング）
+# ---------------------
+ROLLUP_CHANNEL_IDS = [int(x) for x in os.getenv("ROLLUP_CHANNEL_IDS", "").split(",") if x.strip()] or (
+    [CHANNEL_ID] if CHANNEL_ID else []
+)
+ROLLUP_INTERVAL_MINUTES = float(os.getenv("ROLLUP_INTERVAL_MINUTES", "10"))
+ROLLUP_LOOKBACK_HOURS = int(os.getenv("ROLLUP_LOOKBACK_HOURS", "26"))
+
+rollup_locks = {}  # チャンネルID -> asyncio.Lock（同じ時間帯を二重に要約しない）
+rollup_semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+async def _summarize_hour(channel_id: int, hour_start: float, count: int, closed: bool):
+    start = datetime.fromtimestamp(hour_start, timezone.utc)
+    rows = await message_store.fetch_range(channel_id, start, start + timedelta(hours=1))
+    async with rollup_semaphore:
+        summary = await summarize_conversation(
+            rows,
+            "以下は Discord のチャンネルにおける1時間分の会話ログです。出来事や話題を箇条書きで簡潔にまとめてください。",
+            "以下は Discord のチャンネルにおける1時間分の会話ログを区切って要約したものです。箇条書きで簡潔に統合してください。",
+        )
+    # 終わった時間帯だけ保存する（件数が変われば次回作り直す）
+    if closed:
+        await message_store.save_hourly_summary(channel_id, hour_start, count, summary)
+    return summary
+
+async def hourly_partials(channel, start: datetime, end: datetime) -> list:
+    # 範囲内の各時間帯の要約を返す。保存済みはそのまま使い、未作成・古いものだけ作る
+    lock = rollup_locks.setdefault(channel.id, asyncio.Lock())
+    async with lock:
+        counts = await message_store.hour_counts(channel.id, start, end)
+        stored = await message_store.hourly_summaries(channel.id, start, end)
+        now_ts = datetime.now(timezone.utc).timestamp()
+        summaries = {}
+        jobs = {}
+        for hour_start, count in counts.items():
+            saved = stored.get(hour_start)
+            if saved and saved[0] == count:
+                summaries[hour_start] = saved[1]
+            else:
+                jobs[hour_start] = _summarize_hour(channel.id, hour_start, count, hour_start + 3600 <= now_ts)
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+        for hour_start, result in zip(jobs, results):
+            if isinstance(result, BaseException):
+                print(f"[時間別要約エラー] {channel.id} {hour_start}: {result!r}")
+            else:
+                summaries[hour_start] = result
+    partials = []
+    for hour_start in sorted(summaries):
+        hour = datetime.fromtimestamp(hour_start, JST).strftime("%H時台")
+        partials.append(f"【{hour}】\n{summaries[hour_start]}")
+    return partials
+
+@scheduler.every("rollup_hourly_summaries", ROLLUP_INTERVAL_MINUTES * 60)
+async def rollup_hourly_summaries():
+    # 終わった時間帯を少しずつ要約しておき、7:00 の日報はそれを統合するだけにする
+    end = datetime.now(JST).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=ROLLUP_LOOKBACK_HOURS)
+    for channel_id in ROLLUP_CHANNEL_IDS:
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            continue
+        try:
+            await hourly_partials(channel, start, end)
+        except Exception as e:
+            print(f"[時間別要約エラー] {channel_id}: {e!r}")
+
+# ---------------------
+# 日次まとめ
+# ---------------------
+@scheduler.daily("daily_summary", time(7, 0))
+async def daily_summary():
+    await bot.wait_until_ready()
+    channel = bot.get_channel(CHANNEL_ID)
+    if channel:
+        await summarize_logs(channel)
+
+async def summarize_logs(channel):
+    now = datetime.now(JST)
+
+    # 集計範囲：昨日7:00 ～ 今日7:00
+    start_time = datetime(now.year, now.month, now.day, 7, 0, 0, tzinfo=JST) - timedelta(days=1)
+    end_time   = datetime(now.year, now.month, now.day, 7, 0, 0, tzinfo=JST)
+
+    # ローカルのログから取得（足りない区間だけ Discord から補完）
+    await message_store.ensure_range(channel, start_time)
+    counts = await message_store.hour_counts(channel.id, start_time, end_time)
+
+    if not counts:
+        await channel.send("昨日は何も話されていなかったみたい・・・")
+        return
+
+    try:
+        # 作成済みの時間別要約を統合する（足りない時間帯だけここで作る）
+        with metrics.timer("nadeko_summary_seconds", stage="日報"):
+            partials = await hourly_partials(channel, start_time, end_time)
+            if not partials:
+                raise RuntimeError("時間別要約がひとつも作れなかった")
+            summary = await _reduce_summaries(
+                partials,
+                "以下は Discord のチャンネルにおける昨日の 7:00〜今日の 6:59 までの会話ログを、時間帯ごとに要約したものです。\n"
+                "全体をまとめて簡単に報告してください。",
+            )
+        await channel.send(f"\U0001F4CB **昨日のまとめだよ・・・**\n{summary}")
+    except Exception as e:
+        print(f"[要約エラー] {e}")
+        await channel.send("ごめんね、昨日のまとめを作れなかった・・・")
+
+# 強制まとめトリガー
+@message_handler
+async def summary_trigger(message):
+    if message.content.strip() != "できごとまとめ":
+        return False
+    await summarize_logs(message.channel)
+    return True
@@ -0,0 +1,117 @@
+import os
+import time as _time
+import asyncio
+from collections import deque
+from nadeko.metrics import metrics, percentile
+
+# ---------------------
+# プロバイダーの健康状態（適応タイムアウト + サーキットブレーカー）
+# ---------------------
+PROVIDER_WINDOW = int(os.getenv("PROVIDER_WINDOW", "100"))
+PROVIDER_FAILURE_THRESHOLD = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "5"))  # 連続失敗でオープン
+PROVIDER_ERROR_RATE = float(os.getenv("PROVIDER_ERROR_RATE", "0.5"))  # 直近のエラー率でオープン
+PROVIDER_OPEN_SECONDS = float(os.getenv("PROVIDER_OPEN_SECONDS", "30"))  # オープン後、試しに通すまでの時間
+
+class ProviderUnavailable(Exception):
+    pass
+
+class ProviderHealth:
+    def __init__(self, name: str, base_timeout: float, min_timeout: float, max_timeout: float):
+        self.name = name
+        self.base_timeout = base_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.latencies = deque(maxlen=PROVIDER_WINDOW)
+        self.outcomes = deque(maxlen=PROVIDER_WINDOW)  # True=成功 / False=失敗
+        self.state = "closed"  # closed / open / half_open
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def percentile(self, q: float) -> float:
+        return percentile(self.latencies, q)
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def timeout(self) -> float:
+        # 十分なサンプルがあれば p99 の2倍を上下限で丸めて使う
+        if len(self.latencies) < 10:
+            return self.base_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.percentile(0.99) * 2))
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and _time.monotonic() - self.opened_at >= PROVIDER_OPEN_SECONDS:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True  # 復旧確認のため1件だけ通す
+            return True
+        return False
+
+    def is_open(self) -> bool:
+        # allow() と違って状態を変えない（呼ぶ前の下準備を省くかどうかの判断用）
+        return self.state == "open" and _time.monotonic() - self.opened_at < PROVIDER_OPEN_SECONDS
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self._probing = False
+        if self.state != "closed":
+            print(f"[{self.name}] 復旧したみたい")
+            self.state = "closed"
+            self.outcomes.clear()
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self._probing = False
+        tripped = self.consecutive_failures >= PROVIDER_FAILURE_THRESHOLD or (
+            len(self.outcomes) >= 10 and self.error_rate() >= PROVIDER_ERROR_RATE
+        )
+        if self.state == "half_open" or (self.state == "closed" and tripped):
+            print(f"[{self.name}] 停止中とみなして {PROVIDER_OPEN_SECONDS:.0f} 秒スキップするよ")
+            self.state = "open"
+            self.opened_at = _time.monotonic()
+
+    async def call(self, factory, timeout: float = None):
+        if not self.allow():
+            metrics.inc("nadeko_provider_rejected_total", provider=self.name)
+            raise ProviderUnavailable(f"{self.name} は停止中")
+        started = _time.monotonic()
+        try:
+            with metrics.timer("nadeko_provider_seconds", provider=self.name):
+                result = await asyncio.wait_for(factory(), timeout=timeout or self.timeout())
+        except asyncio.CancelledError:
+            # ヘッジで負けた場合など。失敗扱いにはせず、経過時間を下限値として残す
+            self.latencies.append(_time.monotonic() - started)
+            self._probing = False
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(_time.monotonic() - started)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "error_rate": self.error_rate(),
+            "timeout": self.timeout(),
+        }
+
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "5"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "10"))
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "60"))
+OPENROUTER_LONG_TIMEOUT = float(os.getenv("OPENROUTER_LONG_TIMEOUT", "180"))  # 要約など長いプロンプト用
+
+serpapi_health = ProviderHealth("SerpAPI", SERPAPI_TIMEOUT, 2.0, SERPAPI_TIMEOUT * 2)
+gemini_health = ProviderHealth("Gemini", GEMINI_TIMEOUT, 4.0, GEMINI_TIMEOUT * 2)
+openrouter_health = ProviderHealth("OpenRouter", OPENROUTER_TIMEOUT, 15.0, OPENROUTER_TIMEOUT * 1.5)
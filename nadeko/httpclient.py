@@ -0,0 +1,13 @@
+import os
+import aiohttp
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+http_session = None  # keep-alive の共有セッション（初回利用時に作成）
+
+async def get_http_session() -> aiohttp.ClientSession:
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300, keepalive_timeout=60)
+        http_session = aiohttp.ClientSession(connector=connector)
+    return http_session
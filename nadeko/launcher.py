@@ -0,0 +1,35 @@
+import os
+import multiprocessing
+from dotenv import load_dotenv
+
+# ---------------------
+# 起動（SHARD_PROCESSES > 1 ならシャードを複数プロセスに分けて動かす）
+# ---------------------
+# ここではボット本体を import しない。子プロセスは環境変数を決めてから読み込む
+
+def _run(shard_ids=None):
+    if shard_ids is not None:
+        os.environ["SHARD_IDS"] = ",".join(str(i) for i in shard_ids)
+    from nadeko.app import main
+    main()
+
+def launch():
+    load_dotenv()
+    processes = int(os.getenv("SHARD_PROCESSES", "1"))
+    shard_count = int(os.getenv("SHARD_COUNT", "0"))
+    if processes <= 1:
+        _run()
+        return
+    if shard_count < processes:
+        raise SystemExit("SHARD_PROCESSES を使うときは、それ以上の SHARD_COUNT を指定してね")
+    # プロセスをまたいでクールダウンやキャッシュを共有する
+    os.environ.setdefault("STATE_BACKEND", "sqlite")
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_run, args=(list(range(i, shard_count, processes)),), name=f"nadeko-shards-{i}")
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
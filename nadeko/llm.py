@@ -0,0 +1,354 @@
+import os
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from nadeko.config import GEMINI_API_KEY, OPENROUTER_API_KEY, system_instruction
+from nadeko.health import gemini_health, openrouter_health
+from nadeko.metrics import metrics
+from nadeko.prompts import build_search_prompt
+from nadeko.search import serpapi_search
+from nadeko.sessions import chat_sessions
+from nadeko.singleflight import SingleFlight
+
+# ---------------------
+# プロバイダー SDK（初回利用時に LLM スレッドで読み込む）
+# ---------------------
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "tngtech/deepseek-r1t2-chimera:free")
+
+gemini_enabled = bool(GEMINI_API_KEY)
+openrouter_enabled = bool(OPENROUTER_API_KEY)
+
+_sdk_lock = threading.Lock()
+_gemini_model = None
+_openrouter_client = None
+
+def get_gemini_model():
+    # google.generativeai は読み込みが重いので、最初に Gemini を呼ぶときまで import しない
+    global _gemini_model
+    with _sdk_lock:
+        if _gemini_model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            _gemini_model = genai.GenerativeModel("gemini-pro")
+    return _gemini_model
+
+def get_openrouter_client():
+    global _openrouter_client
+    with _sdk_lock:
+        if _openrouter_client is None:
+            from openai import OpenAI
+            _openrouter_client = OpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=OPENROUTER_API_KEY
+            )
+    return _openrouter_client
+
+def _openrouter_create(**kwargs):
+    return get_openrouter_client().chat.completions.create(model=OPENROUTER_MODEL, **kwargs)
+
+def _session_history(session_key) -> list:
+    # 履歴には質問と返答だけを残し、検索結果や指示文は毎回付け直す
+    # chat_sessions はイベントループ側で書き換えるので、読むのもループのスレッドで行う
+    return chat_sessions.history(session_key) if session_key else []
+
+# ---------------------
+# LLM 実行キュー（優先度つき・上限あり）
+# ---------------------
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))  # 同時に走らせる LLM 呼び出しの数
+LLM_MAX_WAITING = int(os.getenv("LLM_MAX_WAITING", "8"))  # メンションがこれ以上並んでいたら混雑と返す
+
+PRIORITY_MENTION = 0
+PRIORITY_SUMMARY = 1
+PRIORITY_AUTO_CHAT = 2
+
+# 呼び出し元ごとの優先度（タスクに引き継がれるので、入口で一度設定すればよい）
+llm_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_SUMMARY)
+llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS * 2, thread_name_prefix="llm")
+
+class LLMBusy(Exception):
+    pass
+
+class LLMGate:
+    def __init__(self, workers: int, max_waiting: int):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.dropped = 0
+        self._waiters = []  # (優先度, 到着順, Future) のヒープ
+        self._seq = itertools.count()
+
+    def waiting(self) -> int:
+        return sum(1 for _p, _s, f in self._waiters if not f.done())
+
+    def queue_position(self, priority: int) -> int:
+        # 今からこの優先度で並んだら何番目か（すぐ実行できるなら 0）
+        if self.active < self.workers and not self.waiting():
+            return 0
+        return 1 + sum(1 for p, _s, f in self._waiters if p <= priority and not f.done())
+
+    def is_full(self, priority: int) -> bool:
+        if priority == PRIORITY_SUMMARY:
+            return False  # 要約は落とさず後回しにする
+        position = self.queue_position(priority)
+        if priority == PRIORITY_AUTO_CHAT:
+            return position > 0  # 自動会話は空きがなければやめる
+        return position > self.max_waiting
+
+    async def acquire(self, priority: int):
+        if self.active < self.workers and not self.waiting():
+            self.active += 1
+            return
+        if self.is_full(priority):
+            self.dropped += 1
+            raise LLMBusy("LLM の実行枠が埋まっている")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # 枠を受け取った直後に取り消された
+            raise
+
+    def release(self):
+        # 空いた枠は優先度の高い順に引き渡す
+        while self._waiters:
+            _priority, _seq, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+llm_gate = LLMGate(LLM_WORKERS, LLM_MAX_WAITING)
+
+async def run_llm(factory):
+    # 枠を確保してから実行する（待ち時間はプロバイダーの計測に含めない）
+    await llm_gate.acquire(llm_priority.get())
+    try:
+        return await factory()
+    finally:
+        llm_gate.release()
+
+class HeldStream:
+    # ストリームを読み終える（または閉じる）まで実行枠を持ち続けるラッパー
+    def __init__(self, stream):
+        self.stream = stream
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.stream.__anext__()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            llm_gate.release()
+            await self.stream.aclose()
+
+async def run_llm_stream(factory):
+    await llm_gate.acquire(llm_priority.get())
+    try:
+        first, stream = await factory()
+    except BaseException:
+        llm_gate.release()
+        raise
+    return first, HeldStream(stream)
+
+async def in_llm_thread(func, *args, **kwargs):
+    # 既定のスレッドプールを他の処理と取り合わないよう、LLM 専用のプールで実行する
+    return await asyncio.get_running_loop().run_in_executor(llm_executor, lambda: func(*args, **kwargs))
+
+# ---------------------
+# プロバイダー呼び出し
+# ---------------------
+openrouter_flights = SingleFlight()
+
+async def gemini_search_prompt(query):
+    # 検索は Gemini の呼び出しの前に済ませ、SerpAPI の遅さを Gemini のタイムアウトや統計に含めない
+    search_result = await serpapi_search(query)
+    return build_search_prompt(query, search_result)
+
+async def gemini_search_reply(full_query, session_key=None):
+    # full_query は gemini_search_prompt で組み立てたもの
+    if not gemini_enabled:
+        return "Gemini が利用できないよ・・・"
+    history = _session_history(session_key)
+    chat = await in_llm_thread(lambda: get_gemini_model().start_chat(history=history))
+    response = await in_llm_thread(chat.send_message, full_query)
+    return response.text
+
+async def openrouter_complete(query, timeout=None):
+    # 失敗時は例外をそのまま投げる版（ヘッジや要約のリトライ用）
+    if not openrouter_enabled:
+        raise RuntimeError("OpenRouter が設定されていない")
+    # まったく同じプロンプトが実行中なら、その結果を共有する
+    completion, _leader = await openrouter_flights.do(query, lambda: run_llm(lambda: openrouter_health.call(lambda: in_llm_thread(
+        _openrouter_create,
+        messages=[
+            {"role": "system", "content": system_instruction},
+            {"role": "user", "content": query}
+        ]
+    ), timeout=timeout)))
+    return completion.choices[0].message.content.strip()
+
+async def openrouter_reply(query, timeout=None):
+    if not openrouter_enabled:
+        return "OpenRouter が利用できないよ・・・"
+    try:
+        return await openrouter_complete(query, timeout=timeout)
+    except Exception as e:
+        print(f"[OpenRouterエラー] {e}")
+        return "ごめんね、ちょっと考えがまとまらなかったかも"
+
+# ---------------------
+# ヘッジリクエスト（Gemini と OpenRouter の先着採用）
+# ---------------------
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "4.0"))  # 観測データが少ないときの待ち時間
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "10.0"))
+HEDGE_TOTAL_TIMEOUT = float(os.getenv("HEDGE_TOTAL_TIMEOUT", "60.0"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+
+provider_wins = Counter()
+
+def hedge_delay() -> float:
+    if len(gemini_health.latencies) < 10:
+        return HEDGE_DELAY
+    return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, gemini_health.percentile(HEDGE_PERCENTILE)))
+
+async def hedged_request(candidates, delay: float, timeout: float = HEDGE_TOTAL_TIMEOUT, discard=None):
+    # candidates: [(名前, コルーチンを返す関数), ...] を優先順に。
+    # 先頭を起動し、delay 秒たっても返らない（または失敗した）ら次を起動して、最初に成功した結果を使う
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pending = {}
+    waiting = list(candidates)
+    last_error = None
+
+    def launch():
+        name, factory = waiting.pop(0)
+        role = "primary" if len(waiting) == len(candidates) - 1 else "fallback"
+        metrics.inc("nadeko_hedge_launches_total", provider=name, role=role)
+        pending[asyncio.ensure_future(factory())] = name
+
+    launch()
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError("ヘッジリクエストがタイムアウト")
+            wait_for = min(delay, remaining) if waiting else remaining
+            done, _ = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if waiting:
+                    launch()
+                continue
+            for task in done:
+                name = pending.pop(task)
+                if task.exception() is None:
+                    provider_wins[name] += 1
+                    return name, task.result()
+                last_error = task.exception()
+                print(f"[ヘッジ:{name}エラー] {last_error!r}")
+            # 失敗したら待たずに次の候補を起動する
+            if waiting and not pending:
+                launch()
+        raise last_error or RuntimeError("利用できるプロバイダーがない")
+    finally:
+        # 負けた側はキャンセルする（経過時間は ProviderHealth が下限値として記録する）
+        for task in pending:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                # 同時に成功して使われなかった結果は discard で後始末する
+                if discard:
+                    discard(task.result())
+            else:
+                task.cancel()
+
+# ---------------------
+# ストリーミング呼び出し
+# ---------------------
+async def _iterate_in_thread(make_iter):
+    # 同期SDKのストリームを別スレッドで回し、チャンクをキュー経由で受け取る
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def push(kind, value=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+        except RuntimeError:
+            pass  # ループ終了後は捨てる
+
+    def worker():
+        try:
+            for item in make_iter():
+                if stop.is_set():
+                    break
+                push("item", item)
+        except Exception as e:
+            push("error", e)
+        finally:
+            push("done")
+
+    loop.run_in_executor(llm_executor, worker)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "done":
+                break
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+async def stream_gemini_reply(full_query, session_key=None):
+    if not gemini_enabled:
+        raise RuntimeError("Gemini が設定されていない")
+    history = _session_history(session_key)
+    chat = await in_llm_thread(lambda: get_gemini_model().start_chat(history=history))
+    async for chunk in _iterate_in_thread(lambda: chat.send_message(full_query, stream=True)):
+        text = chunk.text
+        if text:
+            yield text
+
+async def stream_openrouter_reply(query):
+    if not openrouter_enabled:
+        raise RuntimeError("OpenRouter が設定されていない")
+
+    def create_stream():
+        return _openrouter_create(
+            messages=[
+                {"role": "system", "content": system_instruction},
+                {"role": "user", "content": query}
+            ],
+            stream=True
+        )
+
+    async for chunk in _iterate_in_thread(create_stream):
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content
+        if text:
+            yield text
+
+async def prime_stream(stream, timeout=None):
+    # 最初のチャンクが届くまで待つ（届かなければ例外）。届いたら (最初のチャンク, 残り) を返す
+    try:
+        first = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+    except StopAsyncIteration:
+        raise RuntimeError("空の応答")
+    except BaseException:
+        await stream.aclose()
+        raise
+    return first, stream
@@ -0,0 +1,148 @@
+import os
+import time as _time
+import asyncio
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# ---------------------
+# メトリクス（カウンタ + レイテンシのヒストグラム、Prometheus 形式で出力）
+# ---------------------
+METRICS_SAMPLES = int(os.getenv("METRICS_SAMPLES", "500"))  # !stats のパーセンタイル計算に残す直近の件数
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # 最後は +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=METRICS_SAMPLES)
+
+    def observe(self, value: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+class Metrics:
+    def __init__(self):
+        self._help = {}  # 名前 -> (種類, 説明)
+        self._counters = defaultdict(float)  # (名前, ラベル) -> 値
+        self._histograms = defaultdict(Histogram)  # (名前, ラベル) -> Histogram
+        self._collected = {}  # 名前 -> 値（またはラベルごとの値のリスト）を返す関数。gauge と counter_func を出力時に呼ぶ
+
+    def counter(self, name: str, help_text: str):
+        self._help[name] = ("counter", help_text)
+
+    def histogram(self, name: str, help_text: str):
+        self._help[name] = ("histogram", help_text)
+
+    def gauge(self, name: str, help_text: str, func):
+        # 既存のオブジェクトが持っている件数などは、出力するときに読みに行く
+        self._help[name] = ("gauge", help_text)
+        self._collected[name] = func
+
+    def counter_func(self, name: str, help_text: str, func):
+        # gauge と同じく出力時に読むが、累計値なので counter として出す（名前は _total で終える）
+        self._help[name] = ("counter", help_text)
+        self._collected[name] = func
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        self._counters[(name, _labels(labels))] += amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        self._histograms[(name, _labels(labels))].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        # 経過時間を outcome（ok / error / cancelled）つきで記録する
+        started = _time.monotonic()
+        outcome = "ok"
+        try:
+            yield
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.observe(name, _time.monotonic() - started, outcome=outcome, **labels)
+
+    def latency_summary(self) -> list:
+        # [(名前, ラベル, 件数, p50, p95)]。!stats 用
+        rows = []
+        for (name, labels), hist in sorted(self._histograms.items()):
+            rows.append((name, dict(labels), hist.count, percentile(hist.recent, 0.5), percentile(hist.recent, 0.95)))
+        return rows
+
+    def counters(self) -> list:
+        # [(名前, ラベル, 値)]。!stats 用
+        return [(name, dict(labels), value) for (name, labels), value in sorted(self._counters.items())]
+
+    def gauge_values(self, name: str) -> dict:
+        try:
+            value = self._collected[name]()
+        except Exception as e:
+            print(f"[メトリクス] {name} を読めなかった: {e!r}")
+            return {}
+        if isinstance(value, list):
+            return {_labels(labels): v for labels, v in value}  # [(ラベルの dict, 値), ...]
+        return {(): value}
+
+    def render(self) -> str:
+        lines = []
+        by_name = defaultdict(list)
+        for (name, labels), value in self._counters.items():
+            by_name[name].append((labels, value))
+        hists = defaultdict(list)
+        for (name, labels), hist in self._histograms.items():
+            hists[name].append((labels, hist))
+        for name in sorted(set(self._help) | set(by_name) | set(hists)):
+            kind, help_text = self._help.get(name, ("histogram" if name in hists else "counter", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if name in self._collected:
+                for labels, value in sorted(self.gauge_values(name).items()):
+                    lines.append(f"{name}{_format_labels(labels)} {float(value)}")
+            elif kind == "histogram":
+                for labels, hist in sorted(hists[name], key=lambda item: item[0]):
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), hist.buckets):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+            else:
+                for labels, value in sorted(by_name[name]):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+metrics.histogram("nadeko_provider_seconds", "SerpAPI / Gemini / OpenRouter の呼び出し時間")
+metrics.counter("nadeko_provider_rejected_total", "サーキットブレーカーで呼ばずに断った回数")
+metrics.counter("nadeko_hedge_launches_total", "ヘッジで起動した候補（role=fallback は予備の起動）")
+metrics.histogram("nadeko_mention_seconds", "メンションを受けてから返答し終えるまでの時間")
+metrics.histogram("nadeko_discord_seconds", "Discord API（送信・編集）の呼び出し時間")
+metrics.histogram("nadeko_summary_seconds", "要約の LLM 呼び出し・日報全体の時間")
+metrics.histogram("nadeko_rss_seconds", "RSS フィードの取得時間")
+metrics.histogram("nadeko_job_seconds", "スケジューラのジョブの実行時間")
+metrics.counter("nadeko_rss_not_modified_total", "RSS フィードが 304 で前回の結果を使えた回数")
@@ -0,0 +1,97 @@
+import os
+import re
+from nadeko.config import system_instruction
+
+# ---------------------
+# プロンプト組み立て（トークン予算つき）
+# ---------------------
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+
+def estimate_tokens(text: str) -> int:
+    # 日本語などの非ASCII文字は1文字≒1トークン、ASCIIは4文字≒1トークンで概算
+    text = text or ""
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+def compress_text(text: str) -> str:
+    # 連続する空白・空行をまとめるだけの軽い圧縮
+    text = re.sub(r"[ \t\u3000]+", " ", text or "")
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+def trim_to_tokens(text: str, budget: int, keep: str = "head") -> str:
+    # keep="head" なら末尾から、keep="tail" なら先頭から行単位で削る（履歴は新しい方を残す）
+    if estimate_tokens(text) <= budget:
+        return text
+    lines = text.split("\n")
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], 0
+    for line in lines:
+        line_tokens = estimate_tokens(line) + 1
+        if used + line_tokens > budget:
+            if not kept and budget > 0:
+                kept.append(line[-budget:] if keep == "tail" else line[:budget])
+            break
+        kept.append(line)
+        used += line_tokens
+    if keep == "tail":
+        kept.reverse()
+    return "\n".join(kept)
+
+class PromptBuilder:
+    def __init__(self, name: str, max_tokens: int = PROMPT_MAX_TOKENS):
+        self.name = name
+        self.max_tokens = max_tokens
+        self.sections = []
+
+    def add(self, name: str, text: str, header: str = "", budget: int = None, priority: int = 0, keep: str = "head"):
+        # priority が小さいセクションほど、全体が予算を超えたときに先に削られる
+        self.sections.append({
+            "name": name, "text": compress_text(text), "header": header,
+            "budget": budget, "priority": priority, "keep": keep,
+        })
+        return self
+
+    def _trim(self, section: dict, budget: int, dropped: dict, reason: str):
+        # dropped: (セクション名, どの上限で削ったか) -> 削ったトークン数
+        before = estimate_tokens(section["text"])
+        section["text"] = trim_to_tokens(section["text"], max(0, budget), section["keep"])
+        removed = before - estimate_tokens(section["text"])
+        if removed > 0:
+            key = (section["name"], reason)
+            dropped[key] = dropped.get(key, 0) + removed
+
+    def build(self) -> str:
+        dropped = {}
+        for section in self.sections:
+            if section["budget"] is not None:
+                self._trim(section, section["budget"], dropped, f"セクション上限 {section['budget']}")
+        total = sum(estimate_tokens(s["header"] + s["text"]) + 1 for s in self.sections)
+        for section in sorted(self.sections, key=lambda s: s["priority"]):
+            if total <= self.max_tokens:
+                break
+            before = estimate_tokens(section["text"])
+            self._trim(section, before - (total - self.max_tokens), dropped, f"全体予算 {self.max_tokens}")
+            total -= before - estimate_tokens(section["text"])
+        if dropped:
+            detail = ", ".join(f"{name} -{tokens} トークン（{reason}）" for (name, reason), tokens in dropped.items())
+            print(f"[プロンプト:{self.name}] 予算に合わせて削ったよ: {detail}")
+        return "\n".join(s["header"] + s["text"] for s in self.sections if s["text"])
+
+def build_search_prompt(query: str, search_result: str) -> str:
+    return (
+        PromptBuilder("gemini")
+        .add("system", system_instruction, priority=3)
+        .add("question", query, header="ユーザーの質問: ", budget=1000, priority=2)
+        .add("search", search_result, header="事前の検索結果: ", budget=1500, priority=1)
+        .build()
+    )
+
+def build_log_prompt(name: str, instruction: str, body: str, keep: str = "head") -> str:
+    # 指示文は残し、ログ本文のほうを予算に合わせて削る
+    return (
+        PromptBuilder(name)
+        .add("instruction", instruction, priority=2)
+        .add("log", body, header="\n", priority=1, keep=keep)
+        .build()
+    )
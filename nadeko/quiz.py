@@ -0,0 +1,184 @@
+import json
+import os
+import random
+import time
+import unicodedata
+import discord
+from collections import deque
+
+QUIZ_BANK_PATH = os.getenv("QUIZ_BANK_PATH", os.path.join(os.path.dirname(__file__), "quiz_questions.json"))
+QUIZ_FUZZY_RATIO = float(os.getenv("QUIZ_FUZZY_RATIO", "0.2"))  # 正解文の長さに対して許す打ち間違いの割合
+QUIZ_RECENT_EXCLUDE = int(os.getenv("QUIZ_RECENT_EXCLUDE", "3"))  # 直近に出した問題は避ける
+
+def _to_hiragana(ch: str) -> str:
+    code = ord(ch)
+    if 0x30A1 <= code <= 0x30F6:  # ァ〜ヶ
+        return chr(code - 0x60)
+    return ch
+
+def normalize_answer(text: str) -> str:
+    # 全角/半角・カタカナ/ひらがな・大文字/小文字・空白と句読点の違いを吸収する
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(
+        _to_hiragana(ch) for ch in text
+        if not unicodedata.category(ch).startswith(("Z", "P", "C"))
+    )
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    # limit を超えた時点で打ち切るレーベンシュタイン距離
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def answer_matches(answer: str, accepted: list, ratio: float = QUIZ_FUZZY_RATIO) -> bool:
+    given = normalize_answer(answer)
+    if not given:
+        return False
+    for candidate in accepted:
+        expected = normalize_answer(candidate)
+        if given == expected:
+            return True
+        limit = int(len(expected) * ratio)
+        if limit and edit_distance(given, expected, limit) <= limit:
+            return True
+    return False
+
+class Question:
+    def __init__(self, text: str, answers: list, hint: str = ""):
+        self.text = text
+        self.answers = answers
+        self.hint = hint
+
+    def check(self, answer: str) -> bool:
+        return answer_matches(answer, self.answers)
+
+class QuestionBank:
+    def __init__(self, questions: list):
+        self.questions = questions
+        self._recent = deque(maxlen=min(QUIZ_RECENT_EXCLUDE, max(len(questions) - 1, 0)))
+
+    @classmethod
+    def load(cls, path: str = QUIZ_BANK_PATH, fallback: list = None):
+        try:
+            with open(path, encoding="utf-8") as f:
+                raw = json.load(f)
+            questions = [Question(q["question"], q["answers"], q.get("hint", "")) for q in raw]
+        except Exception as e:
+            print(f"[クイズ読込エラー] {e}")
+            questions = []
+        if not questions:
+            questions = list(fallback or [])
+        return cls(questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def pick(self) -> Question:
+        candidates = [i for i in range(len(self.questions)) if i not in self._recent]
+        index = random.choice(candidates or range(len(self.questions)))
+        if self._recent.maxlen:
+            self._recent.append(index)
+        return self.questions[index]
+
+class Quiz:
+    def __init__(self, question: Question, channel_id: int, message_id: int, duration: float):
+        self.question = question
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.deadline = time.monotonic() + duration
+        self.solvers = []  # 正解した順の user_id
+
+    @property
+    def open(self) -> bool:
+        return time.monotonic() < self.deadline
+
+class QuizManager:
+    # 問題メッセージの id から出題中のクイズを引く。チャンネルごとに1問ずつ同時に出題できる
+    def __init__(self):
+        self._by_message = {}  # message_id -> Quiz
+        self._by_channel = {}  # channel_id -> Quiz
+        self._reserved = set()  # 問題メッセージを送信中のチャンネル
+
+    def __len__(self):
+        return len(self._by_message)
+
+    def active_in(self, channel_id: int) -> bool:
+        if channel_id in self._reserved:
+            return True
+        quiz = self._by_channel.get(channel_id)
+        return quiz is not None and quiz.open
+
+    def reserve(self, channel_id: int) -> bool:
+        # 送信の await 中に同じチャンネルへ二重に出題しないよう先に押さえる
+        if self.active_in(channel_id):
+            return False
+        self._reserved.add(channel_id)
+        return True
+
+    def release(self, channel_id: int):
+        self._reserved.discard(channel_id)
+
+    def start(self, question: Question, channel_id: int, message_id: int, duration: float) -> Quiz:
+        self._reserved.discard(channel_id)
+        previous = self._by_channel.get(channel_id)
+        if previous:
+            self.finish(previous)
+        quiz = Quiz(question, channel_id, message_id, duration)
+        self._by_message[message_id] = quiz
+        self._by_channel[channel_id] = quiz
+        return quiz
+
+    def get(self, message_id: int):
+        quiz = self._by_message.get(message_id)
+        if quiz and not quiz.open:
+            self.finish(quiz)
+            return None
+        return quiz
+
+    def finish(self, quiz: Quiz):
+        self._by_message.pop(quiz.message_id, None)
+        if self._by_channel.get(quiz.channel_id) is quiz:
+            del self._by_channel[quiz.channel_id]
+
+    def answer(self, quiz: Quiz, user_id: int, text: str) -> str:
+        # "correct" / "wrong" / "already"（正解済みの人がもう一度答えた）
+        if user_id in quiz.solvers:
+            return "already"
+        if quiz.question.check(text):
+            quiz.solvers.append(user_id)
+            return "correct"
+        return "wrong"
+
+class OnlineCounter:
+    # オンライン人数（presence イベントで差分更新し、定期的に全メンバーと突き合わせる）
+    def __init__(self):
+        self._online = {}  # guild_id -> オンラインの member_id の集合
+
+    @staticmethod
+    def is_online(member) -> bool:
+        return not member.bot and member.status != discord.Status.offline
+
+    def reconcile(self, guild):
+        self._online[guild.id] = {m.id for m in guild.members if self.is_online(m)}
+
+    def update(self, member) -> int:
+        online = self._online.setdefault(member.guild.id, set())
+        if self.is_online(member):
+            online.add(member.id)
+        else:
+            online.discard(member.id)
+        return len(online)
+
+    def remove(self, member):
+        self._online.get(member.guild.id, set()).discard(member.id)
+
+    def count(self, guild_id: int) -> int:
+        return len(self._online.get(guild_id, ()))
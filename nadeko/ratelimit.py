@@ -0,0 +1,92 @@
+import os
+import time as _time
+from nadeko.scheduler import scheduler
+
+# ---------------------
+# メンションのレート制限（トークンバケット）
+# ---------------------
+def _bucket_config(name: str, rate: str, burst: str) -> tuple:
+    # 1秒あたりの回復量と、ためておける上限
+    return float(os.getenv(f"RATE_{name}_PER_SEC", rate)), float(os.getenv(f"RATE_{name}_BURST", burst))
+
+RATE_LIMITS = {
+    "user": _bucket_config("USER", str(1 / 30), "4"),
+    "channel": _bucket_config("CHANNEL", str(1 / 6), "10"),
+    "guild": _bucket_config("GUILD", "0.5", "30"),
+}
+RATE_IDLE_SECONDS = float(os.getenv("RATE_IDLE_SECONDS", "600"))
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # key -> [残りトークン, 更新時刻, 注意した時刻]
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _state(self, key, now: float) -> list:
+        state = self._buckets.get(key)
+        if state is None:
+            state = self._buckets[key] = [self.burst, now, 0.0]
+        else:
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+        return state
+
+    def retry_after(self, key, now: float) -> float:
+        tokens = self._state(key, now)[0]
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def consume(self, key, now: float):
+        self._state(key, now)[0] -= 1
+
+    def should_warn(self, key, now: float, interval: float) -> bool:
+        # 制限中に何度も注意して、それ自体がスパムにならないようにする
+        state = self._state(key, now)
+        if now - state[2] < interval:
+            return False
+        state[2] = now
+        return True
+
+    def sweep(self, now: float, idle: float):
+        # 満タンまで回復して放置されたバケットは、無いのと同じなので捨てる
+        for key in [k for k, (tokens, updated, _w) in self._buckets.items()
+                    if now - updated > idle and tokens + (now - updated) * self.rate >= self.burst]:
+            del self._buckets[key]
+
+class MentionRateLimiter:
+    def __init__(self, limits: dict):
+        self.buckets = {scope: TokenBucket(rate, burst) for scope, (rate, burst) in limits.items()}
+        self.limited = 0
+
+    @staticmethod
+    def _keys(message) -> dict:
+        return {
+            "user": message.author.id,
+            "channel": message.channel.id,
+            "guild": message.guild.id if message.guild else message.channel.id,
+        }
+
+    def check(self, message):
+        # すべてのバケットに空きがあるときだけ消費する。戻り値は (待ち秒数, 注意すべきか)
+        now = _time.monotonic()
+        keys = self._keys(message)
+        wait = max(self.buckets[scope].retry_after(key, now) for scope, key in keys.items())
+        if wait > 0:
+            self.limited += 1
+            return wait, self.buckets["user"].should_warn(keys["user"], now, min(wait, 60.0))
+        for scope, key in keys.items():
+            self.buckets[scope].consume(key, now)
+        return 0.0, False
+
+    def sweep(self):
+        now = _time.monotonic()
+        for bucket in self.buckets.values():
+            bucket.sweep(now, RATE_IDLE_SECONDS)
+
+mention_limiter = MentionRateLimiter(RATE_LIMITS)
+
+@scheduler.every("sweep_rate_limits", RATE_IDLE_SECONDS)
+async def sweep_rate_limits():
+    mention_limiter.sweep()
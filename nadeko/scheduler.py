@@ -0,0 +1,145 @@
+import os
+import time as _time
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timedelta, time
+from nadeko.config import INSTANCE_NAME, JST, MESSAGE_DB_PATH
+from nadeko.metrics import metrics
+
+# ---------------------
+# ジョブスケジューラ（毎日決まった時刻 / 一定間隔）
+# ---------------------
+SCHEDULER_CATCH_UP_HOURS = float(os.getenv("SCHEDULER_CATCH_UP_HOURS", "12"))  # これより古い取りこぼしは実行しない
+SCHEDULER_MAX_SLEEP = 60 * 60
+
+background_tasks = set()
+
+def spawn(coro):
+    # 投げっぱなしのタスクが GC されないよう参照を持っておく
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+class Job:
+    def __init__(self, name: str, func, at: time = None, interval: float = None):
+        self.name = name
+        self.func = func
+        self.at = at  # 毎日この時刻（JST）に実行
+        self.interval = interval  # またはこの秒数ごとに実行
+        self.last_run = None  # 毎日ジョブは直近に実行した予定時刻、間隔ジョブは実行開始時刻
+        self.running = False
+
+    def previous_slot(self, now: datetime) -> datetime:
+        slot = datetime.combine(now.date(), self.at, tzinfo=JST)
+        return slot if slot <= now else slot - timedelta(days=1)
+
+    def next_due(self) -> float:
+        if self.interval is not None:
+            return (self.last_run or 0.0) + self.interval
+        last = datetime.fromtimestamp(self.last_run, JST)
+        return (self.previous_slot(last) + timedelta(days=1)).timestamp()
+
+class JobScheduler:
+    def __init__(self, path: str, instance: str = ""):
+        self.jobs = []
+        self.instance = instance  # 同じ DB を使う別プロセスと実行記録が混ざらないようにする
+        self._task = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS scheduler_state (job TEXT PRIMARY KEY, last_run REAL NOT NULL)")
+            self._conn.commit()
+
+    def daily(self, name: str, at: time):
+        def decorator(func):
+            self.jobs.append(Job(name, func, at=at))
+            return func
+        return decorator
+
+    def every(self, name: str, seconds: float):
+        def decorator(func):
+            self.jobs.append(Job(name, func, interval=seconds))
+            return func
+        return decorator
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._task = spawn(self._run_forever())
+
+    def _state_key(self, name: str) -> str:
+        return f"{name}@{self.instance}" if self.instance else name
+
+    def _load_state(self) -> dict:
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT job, last_run FROM scheduler_state").fetchall())
+        return {job.name: rows[self._state_key(job.name)] for job in self.jobs if self._state_key(job.name) in rows}
+
+    def _save_state(self, name: str, last_run: float):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO scheduler_state VALUES (?, ?)", (self._state_key(name), last_run))
+            self._conn.commit()
+
+    async def _mark(self, job: Job, last_run: float):
+        job.last_run = last_run
+        if job.at is not None:
+            await asyncio.to_thread(self._save_state, job.name, last_run)
+
+    async def _run_job(self, job: Job):
+        try:
+            with metrics.timer("nadeko_job_seconds", job=job.name):
+                await job.func()
+        except Exception as e:
+            print(f"[スケジューラ] {job.name} でエラー: {e!r}")
+        finally:
+            job.running = False
+
+    async def _dispatch(self, job: Job, last_run: float):
+        # 実行前に記録しておくので、同じ予定時刻のジョブは一度しか動かない
+        await self._mark(job, last_run)
+        if job.running:
+            print(f"[スケジューラ] {job.name} はまだ実行中なのでスキップ")
+            return
+        job.running = True
+        spawn(self._run_job(job))
+
+    async def _catch_up(self):
+        state = await asyncio.to_thread(self._load_state)
+        now = datetime.now(JST)
+        for job in self.jobs:
+            if job.at is None:
+                continue
+            slot = job.previous_slot(now)
+            last_run = state.get(job.name)
+            if last_run is None:
+                # 初回起動では過去の分を実行しない
+                await self._mark(job, slot.timestamp())
+            elif last_run < slot.timestamp():
+                if now - slot <= timedelta(hours=SCHEDULER_CATCH_UP_HOURS):
+                    print(f"[スケジューラ] 取りこぼした {job.name} を実行するよ")
+                    await self._dispatch(job, slot.timestamp())
+                else:
+                    await self._mark(job, slot.timestamp())
+            else:
+                job.last_run = last_run
+
+    async def _run_forever(self):
+        await self._catch_up()
+        while True:
+            now = _time.time()
+            for job in self.jobs:
+                if job.next_due() <= now:
+                    if job.interval is not None:
+                        await self._dispatch(job, now)
+                    else:
+                        # 何日分か飛んでいても、直近の予定時刻として一度だけ実行する
+                        await self._dispatch(job, job.previous_slot(datetime.now(JST)).timestamp())
+            # 次に予定のある時刻まで眠る
+            next_due = min((job.next_due() for job in self.jobs), default=now + SCHEDULER_MAX_SLEEP)
+            await asyncio.sleep(min(SCHEDULER_MAX_SLEEP, max(0.0, next_due - _time.time())))
+
+scheduler = JobScheduler(MESSAGE_DB_PATH, INSTANCE_NAME)
@@ -0,0 +1,138 @@
+import os
+import re
+import time as _time
+import asyncio
+import unicodedata
+from collections import OrderedDict
+from nadeko.config import SERPAPI_KEY
+from nadeko.health import serpapi_health
+from nadeko.httpclient import get_http_session
+from nadeko.singleflight import SingleFlight
+from nadeko.state import shared_state
+
+# ---------------------
+# 検索結果キャッシュ（TTL + LRU）
+# ---------------------
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+MENTION_PATTERN = re.compile(r"<@!?\d+>")
+
+def normalize_query(text: str) -> str:
+    # 全角/半角を NFKC で揃え、メンションを除去し、空白を1つにまとめる
+    text = unicodedata.normalize("NFKC", text or "")
+    text = MENTION_PATTERN.sub(" ", text)
+    return " ".join(text.split()).casefold()
+
+class SearchCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (期限, 値, サイズ)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        item = self._entries.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value, _size = item
+        if expires_at < _time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (_time.monotonic() + self.ttl, value, size)
+        self.bytes += size
+        # 件数・メモリ上限を超えたら古いものから捨てる
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key: str):
+        _expires_at, _value, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+search_cache = SearchCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_TTL)
+
+# ---------------------
+# SerpAPI 検索（共有 aiohttp セッション）
+# ---------------------
+SERPAPI_URL = "https://serpapi.com/search"
+SERPAPI_MAX_CONCURRENCY = int(os.getenv("SERPAPI_MAX_CONCURRENCY", "4"))
+
+serpapi_semaphore = asyncio.Semaphore(SERPAPI_MAX_CONCURRENCY)
+search_flights = SingleFlight()
+
+async def _serpapi_fetch(params):
+    session = await get_http_session()
+    async with session.get(SERPAPI_URL, params=params) as res:
+        res.raise_for_status()
+        return await res.json(content_type=None)
+
+async def _serpapi_call(params):
+    # 同時リクエスト数を制限する。順番待ちは serpapi_health の計測やタイムアウトに含めない
+    async with serpapi_semaphore:
+        return await serpapi_health.call(lambda: _serpapi_fetch(params))
+
+async def serpapi_search(query):
+    if not SERPAPI_KEY:
+        return "検索サービスが設定されていないよ・・・"
+    cache_key = normalize_query(query)
+    cached = search_cache.get(cache_key)
+    if cached is None and shared_state.shared:
+        # 手元に無ければ、他のプロセスが取得した結果を使う
+        cached = await shared_state.get("search", cache_key)
+        if cached is not None:
+            search_cache.put(cache_key, cached)
+    if cached is not None:
+        return cached
+    params = {
+        "q": cache_key,
+        "hl": "ja",
+        "gl": "jp",
+        "api_key": SERPAPI_KEY
+    }
+    try:
+        data, _leader = await search_flights.do(cache_key, lambda: _serpapi_call(params))
+    except Exception as e:
+        print(f"[SerpAPIエラー] {e!r}")
+        return "検索サービスに接続できなかったかな…"
+    if "answer_box" in data and "answer" in data["answer_box"]:
+        result = data["answer_box"]["answer"]
+    elif "organic_results" in data and data["organic_results"]:
+        result = data["organic_results"][0].get("snippet", "検索結果が見つからなかったかな…")
+    else:
+        result = "検索結果が見つからなかったかな…"
+    result = str(result)
+    # 接続エラーはキャッシュせず、取得できた結果だけを保存する
+    search_cache.put(cache_key, result)
+    if shared_state.shared:
+        await shared_state.set("search", cache_key, result, ttl=SEARCH_CACHE_TTL)
+    return result
@@ -0,0 +1,106 @@
+import os
+import time as _time
+from collections import OrderedDict, deque
+from nadeko.prompts import estimate_tokens
+from nadeko.scheduler import spawn
+from nadeko.state import shared_state
+
+# ---------------------
+# Gemini 会話セッション（ユーザー/チャンネル単位）
+# ---------------------
+GEMINI_SESSION_SCOPE = os.getenv("GEMINI_SESSION_SCOPE", "user")  # "user" または "channel"
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "8"))
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "2000"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "500"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", str(60 * 60)))
+
+class ChatSessionManager:
+    def __init__(self, scope: str, max_turns: int, max_tokens: int, max_sessions: int, idle_ttl: float, state=None):
+        self.scope = scope
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.state = state if state is not None and state.shared else None  # 他のプロセスと共有するときだけ書き出す
+        self._sessions = OrderedDict()  # key -> [最終利用時刻, 合計トークン, deque((質問, 返答, トークン))]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def key_for(self, message) -> tuple:
+        if self.scope == "channel":
+            return ("channel", message.channel.id)
+        return ("user", message.channel.id, message.author.id)
+
+    def history(self, key) -> list:
+        self._evict()
+        session = self._sessions.get(key)
+        if session is None:
+            return []
+        history = []
+        for user_text, model_text, _tokens in session[2]:
+            history.append({"role": "user", "parts": [user_text]})
+            history.append({"role": "model", "parts": [model_text]})
+        return history
+
+    async def load(self, key):
+        # 手元に無ければ、別のプロセスで続いていた会話を引き継ぐ
+        if self.state is None or key in self._sessions:
+            return
+        turns = await self.state.get("session", key)
+        if turns:
+            turns = deque(tuple(turn) for turn in turns)
+            self._sessions[key] = [_time.monotonic(), sum(turn[2] for turn in turns), turns]
+            self._evict()
+
+    async def _save(self, key):
+        session = self._sessions.get(key)
+        if session:
+            await self.state.set("session", key, list(session[2]), ttl=self.idle_ttl)
+        else:
+            await self.state.delete("session", key)
+
+    def record(self, key, user_text: str, model_text: str):
+        session = self._sessions.pop(key, None)
+        if session is None:
+            session = [0.0, 0, deque()]
+        tokens = estimate_tokens(user_text) + estimate_tokens(model_text)
+        session[0] = _time.monotonic()
+        session[1] += tokens
+        session[2].append((user_text, model_text, tokens))
+        # ターン数・トークン数の上限を超えたら古いターンから削る
+        turns = session[2]
+        while turns and (len(turns) > self.max_turns or session[1] > self.max_tokens):
+            session[1] -= turns.popleft()[2]
+        if turns:
+            self._sessions[key] = session
+        self._evict()
+        if self.state is not None:
+            spawn(self._save(key))
+
+    def fingerprint(self, key) -> tuple:
+        # 直近のやりとりで文脈を見分ける（履歴なし同士なら同じ文脈）
+        session = self._sessions.get(key)
+        if not session or not session[2]:
+            return ()
+        user_text, model_text, _tokens = session[2][-1]
+        return (len(session[2]), user_text, model_text)
+
+    def clear(self, key):
+        self._sessions.pop(key, None)
+        if self.state is not None:
+            spawn(self.state.delete("session", key))
+
+    def _evict(self):
+        # 先頭ほど長く使われていないので、期限切れ・上限超過分を先頭から落とす
+        deadline = _time.monotonic() - self.idle_ttl
+        while self._sessions:
+            oldest_key, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or oldest[0] < deadline:
+                del self._sessions[oldest_key]
+            else:
+                break
+
+chat_sessions = ChatSessionManager(
+    GEMINI_SESSION_SCOPE, SESSION_MAX_TURNS, SESSION_MAX_TOKENS, SESSION_MAX_SESSIONS, SESSION_IDLE_TTL, shared_state
+)
@@ -0,0 +1,39 @@
+import asyncio
+
+# ---------------------
+# 同一リクエストの相乗り（single-flight）
+# ---------------------
+class SingleFlight:
+    def __init__(self):
+        self.shared = 0  # 相乗りできた回数
+        self._calls = {}  # key -> [実行中の Future, 待っている呼び出し元の数]
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key, factory):
+        # 同じ key の処理が実行中ならその結果を待つ。戻り値は (結果, 自分が実行したか)
+        call = self._calls.get(key)
+        leader = call is None
+        if leader:
+            call = self._calls[key] = [asyncio.ensure_future(factory()), 0]
+            call[0].add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.shared += 1
+        call[1] += 1
+        try:
+            # 呼び出し元がキャンセルされても、相乗りしている他の呼び出しのために処理は続ける
+            return await asyncio.shield(call[0]), leader
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                # 誰も待っていなければ止める（ヘッジで負けた側が実行枠を持ち続けないように）
+                self._forget(key, call)
+                call[0].cancel()
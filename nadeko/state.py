@@ -0,0 +1,153 @@
+import os
+import json
+import time as _time
+import asyncio
+import sqlite3
+import threading
+from nadeko.config import MESSAGE_DB_PATH
+from nadeko.scheduler import scheduler
+
+# ---------------------
+# 共有ステート（プロセスをまたぐクールダウン・キャッシュ・セッションなど）
+# ---------------------
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")  # "memory"（1プロセス）または "sqlite"（同じホストの複数プロセスで共有）
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", MESSAGE_DB_PATH)
+
+def _key(key) -> str:
+    # タプルなどのキーも同じ文字列になるよう JSON にする
+    return key if isinstance(key, str) else json.dumps(key, ensure_ascii=False)
+
+class MemoryState:
+    shared = False  # 他のプロセスからは見えない
+
+    def __init__(self):
+        self._items = {}  # (namespace, key) -> (値, 期限)
+
+    def _get(self, namespace: str, key: str):
+        item = self._items.get((namespace, key))
+        if item is None:
+            return None
+        if item[1] is not None and item[1] < _time.time():
+            del self._items[(namespace, key)]
+            return None
+        return item
+
+    async def get(self, namespace: str, key, default=None):
+        item = self._get(namespace, _key(key))
+        return default if item is None else item[0]
+
+    async def set(self, namespace: str, key, value, ttl: float = None):
+        self._items[(namespace, _key(key))] = (value, _time.time() + ttl if ttl else None)
+
+    async def add(self, namespace: str, key, value=True, ttl: float = None) -> bool:
+        # まだ無いときだけ書き込む（ロック代わり）。書き込めたら True
+        if self._get(namespace, _key(key)) is not None:
+            return False
+        await self.set(namespace, key, value, ttl)
+        return True
+
+    async def incr(self, namespace: str, key, amount: float = 1, ttl: float = None) -> float:
+        # 期限は最初に作ったときだけ設定する（時間枠ごとのカウンタ用）
+        item = self._get(namespace, _key(key))
+        if item is None:
+            item = (0, _time.time() + ttl if ttl else None)
+        self._items[(namespace, _key(key))] = (item[0] + amount, item[1])
+        return item[0] + amount
+
+    async def delete(self, namespace: str, key):
+        self._items.pop((namespace, _key(key)), None)
+
+    async def prune(self):
+        now = _time.time()
+        for k in [k for k, (_v, expires_at) in self._items.items() if expires_at is not None and expires_at < now]:
+            del self._items[k]
+
+class SQLiteState:
+    shared = True
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS shared_state ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    def _run(self, func):
+        # 複数プロセスから同時に書くので、読み書きをひとつのトランザクションにまとめる
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn, _time.time())
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _select(conn, now: float, namespace: str, key: str):
+        row = conn.execute(
+            "SELECT value, expires_at FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < now):
+            return None
+        return json.loads(row[0]), row[1]
+
+    @staticmethod
+    def _upsert(conn, namespace: str, key: str, value, expires_at):
+        conn.execute(
+            "INSERT OR REPLACE INTO shared_state VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), expires_at),
+        )
+
+    async def get(self, namespace: str, key, default=None):
+        item = await asyncio.to_thread(self._run, lambda conn, now: self._select(conn, now, namespace, _key(key)))
+        return default if item is None else item[0]
+
+    async def set(self, namespace: str, key, value, ttl: float = None):
+        await asyncio.to_thread(self._run, lambda conn, now: self._upsert(
+            conn, namespace, _key(key), value, now + ttl if ttl else None
+        ))
+
+    async def add(self, namespace: str, key, value=True, ttl: float = None) -> bool:
+        def add(conn, now):
+            if self._select(conn, now, namespace, _key(key)) is not None:
+                return False
+            self._upsert(conn, namespace, _key(key), value, now + ttl if ttl else None)
+            return True
+        return await asyncio.to_thread(self._run, add)
+
+    async def incr(self, namespace: str, key, amount: float = 1, ttl: float = None) -> float:
+        def incr(conn, now):
+            item = self._select(conn, now, namespace, _key(key)) or (0, now + ttl if ttl else None)
+            self._upsert(conn, namespace, _key(key), item[0] + amount, item[1])
+            return item[0] + amount
+        return await asyncio.to_thread(self._run, incr)
+
+    async def delete(self, namespace: str, key):
+        await asyncio.to_thread(self._run, lambda conn, now: conn.execute(
+            "DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, _key(key))
+        ))
+
+    async def prune(self):
+        await asyncio.to_thread(self._run, lambda conn, now: conn.execute(
+            "DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at < ?", (now,)
+        ))
+
+if STATE_BACKEND == "sqlite":
+    shared_state = SQLiteState(STATE_DB_PATH)
+else:
+    if STATE_BACKEND != "memory":
+        print(f"[設定] 知らない STATE_BACKEND {STATE_BACKEND} なので memory を使うよ")
+    shared_state = MemoryState()
+
+@scheduler.every("prune_shared_state", 60 * 60)
+async def prune_shared_state():
+    try:
+        await shared_state.prune()
+    except Exception as e:
+        print(f"[共有ステート整理エラー] {e!r}")
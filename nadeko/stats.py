@@ -0,0 +1,106 @@
+import os
+from aiohttp import web
+from discord.ext import commands
+from nadeko.bot import bot
+from nadeko.health import gemini_health, openrouter_health, serpapi_health
+from nadeko.llm import llm_gate, openrouter_flights, provider_wins
+from nadeko.metrics import metrics
+from nadeko.ratelimit import mention_limiter
+from nadeko.search import search_cache, search_flights
+from nadeko.watchdog import loop_watchdog
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 なら /metrics を公開しない
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+PROVIDERS = (serpapi_health, gemini_health, openrouter_health)
+
+# ---------------------
+# ゲージ・累計（各オブジェクトが持っている値を出力時に読む）
+# ---------------------
+metrics.gauge("nadeko_llm_active", "実行中の LLM 呼び出し数", lambda: llm_gate.active)
+metrics.gauge("nadeko_llm_waiting", "LLM の実行枠を待っている数", llm_gate.waiting)
+metrics.counter_func("nadeko_llm_dropped_total", "枠が埋まっていて断った LLM 呼び出し", lambda: llm_gate.dropped)
+metrics.gauge(
+    "nadeko_breaker_state", "サーキットブレーカーの状態（0=closed / 1=half_open / 2=open）",
+    lambda: [({"provider": h.name}, BREAKER_STATES[h.state]) for h in PROVIDERS],
+)
+metrics.gauge("nadeko_search_cache_entries", "検索キャッシュの件数", lambda: len(search_cache._entries))
+metrics.counter_func(
+    "nadeko_search_cache_lookups_total", "検索キャッシュの参照（result=hit / miss）",
+    lambda: [({"result": "hit"}, search_cache.hits), ({"result": "miss"}, search_cache.misses)],
+)
+metrics.counter_func(
+    "nadeko_singleflight_shared_total", "同じ呼び出しに相乗りできた回数",
+    lambda: [({"flight": "search"}, search_flights.shared), ({"flight": "openrouter"}, openrouter_flights.shared)],
+)
+metrics.counter_func("nadeko_rate_limited_total", "レート制限で断ったメンション", lambda: mention_limiter.limited)
+metrics.counter_func(
+    "nadeko_hedge_wins_total", "ヘッジで結果を採用されたプロバイダ",
+    lambda: [({"provider": name}, count) for name, count in provider_wins.items()],
+)
+
+# ---------------------
+# /metrics（Prometheus のスクレイプ用）
+# ---------------------
+metrics_runner = None
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server():
+    global metrics_runner
+    if not METRICS_PORT or metrics_runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    metrics_runner = web.AppRunner(app, access_log=None)
+    await metrics_runner.setup()
+    try:
+        await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+        print(f"[メトリクス] http://{METRICS_HOST}:{METRICS_PORT}/metrics で公開中")
+    except OSError as e:
+        print(f"[メトリクスエラー] {e!r}")
+
+# ---------------------
+# !stats（管理者向けの要約）
+# ---------------------
+def _format_labels(labels: dict) -> str:
+    return "".join(f" {k}={v}" for k, v in labels.items())
+
+def render_stats() -> str:
+    lines = ["レイテンシ（直近の p50 / p95 / 件数）"]
+    for name, labels, count, p50, p95 in metrics.latency_summary():
+        lines.append(f"  {name.removeprefix('nadeko_')}{_format_labels(labels)}: {p50:.2f}s / {p95:.2f}s / {count}")
+    lines.append("カウンタ")
+    for name, labels, value in metrics.counters():
+        lines.append(f"  {name.removeprefix('nadeko_')}{_format_labels(labels)}: {value:g}")
+    lines.append(
+        f"LLM: 実行中 {llm_gate.active} / 待ち {llm_gate.waiting()} / 断った {llm_gate.dropped}"
+    )
+    lines.append("ブレーカー: " + ", ".join(f"{h.name}={h.state}" for h in PROVIDERS))
+    lines.append(
+        f"検索キャッシュ: {len(search_cache._entries)}件 ヒット {search_cache.hits} / ミス {search_cache.misses}"
+    )
+    lines.append(f"相乗り: 検索 {search_flights.shared} / OpenRouter {openrouter_flights.shared}")
+    lines.append(f"レート制限: {mention_limiter.limited}")
+    if loop_watchdog.is_running():
+        lines.append(f"イベントループ停止: {loop_watchdog.stalls}回")
+    if provider_wins:
+        lines.append("ヘッジ勝ち: " + ", ".join(f"{name}={count}" for name, count in provider_wins.most_common()))
+    return "\n".join(lines)
+
+@bot.command(name="stats")
+@commands.has_permissions(administrator=True)
+async def stats_command(ctx):
+    text = render_stats()
+    # 2000文字を超えるときは後ろ（ブレーカーやキャッシュの行）を残して前を削る
+    if len(text) > 1900:
+        text = "…\n" + text[-1900:]
+    await ctx.send(f"```\n{text}\n```")
+
+@stats_command.error
+async def stats_command_error(ctx, error):
+    # 管理者以外には反応しない
+    if not isinstance(error, commands.CheckFailure):
+        print(f"[statsエラー] {error!r}")
@@ -0,0 +1,316 @@
+import os
+import asyncio
+import sqlite3
+import threading
+import discord
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from nadeko.bot import bot, message_handler
+from nadeko.config import CHANNEL_ID, MESSAGE_DB_PATH
+from nadeko.scheduler import scheduler, spawn
+
+# ---------------------
+# メッセージログ（SQLite / WAL）
+# ---------------------
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "5"))
+MESSAGE_FLUSH_BATCH = int(os.getenv("MESSAGE_FLUSH_BATCH", "200"))
+MESSAGE_RETENTION_DAYS = int(os.getenv("MESSAGE_RETENTION_DAYS", "30"))
+MESSAGE_BACKFILL_LIMIT = int(os.getenv("MESSAGE_BACKFILL_LIMIT", "5000"))
+
+class MessageStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.started_at = datetime.now(timezone.utc).timestamp()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    channel_id INTEGER NOT NULL,
+                    guild_id INTEGER,
+                    author_id INTEGER NOT NULL,
+                    author_name TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_channel_time ON messages (channel_id, created_at);
+                CREATE TABLE IF NOT EXISTS channel_sync (
+                    channel_id INTEGER PRIMARY KEY,
+                    covered_from REAL NOT NULL,
+                    last_message_id INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS hourly_summaries (
+                    channel_id INTEGER NOT NULL,
+                    hour_start REAL NOT NULL,
+                    message_count INTEGER NOT NULL,
+                    summary TEXT NOT NULL,
+                    PRIMARY KEY (channel_id, hour_start)
+                );
+            """)
+            self._conn.commit()
+
+    @staticmethod
+    def _row(message) -> tuple:
+        return (
+            message.id,
+            message.channel.id,
+            message.guild.id if message.guild else None,
+            message.author.id,
+            message.author.display_name,
+            message.content.strip(),
+            message.created_at.timestamp(),
+        )
+
+    def add(self, message) -> bool:
+        # 書き込みは溜めておき、まとめて flush する。バッチが埋まったら True を返す
+        if message.author.bot or not (message.content or "").strip():
+            return False
+        self._pending.append(self._row(message))
+        return len(self._pending) >= MESSAGE_FLUSH_BATCH
+
+    async def flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        await asyncio.to_thread(self._insert, rows, self.started_at)
+
+    def _insert(self, rows, covered_from: float):
+        last_ids = {}
+        for row in rows:
+            last_ids[row[1]] = max(last_ids.get(row[1], 0), row[0])
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            # 初めて見るチャンネルは、起動時刻以降が揃っているとみなす
+            self._conn.executemany(
+                "INSERT INTO channel_sync (channel_id, covered_from, last_message_id) VALUES (?, ?, ?) "
+                "ON CONFLICT(channel_id) DO UPDATE SET last_message_id = MAX(last_message_id, excluded.last_message_id)",
+                [(channel_id, covered_from, last_id) for channel_id, last_id in last_ids.items()],
+            )
+            self._conn.commit()
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    async def fetch_range(self, channel_id: int, start: datetime, end: datetime) -> list:
+        await self.flush()
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT author_name, content, created_at FROM messages "
+            "WHERE channel_id = ? AND created_at >= ? AND created_at < ? ORDER BY created_at, id",
+            (channel_id, start.timestamp(), end.timestamp()),
+        )
+
+    async def hour_counts(self, channel_id: int, start: datetime, end: datetime) -> dict:
+        # JST は UTC と1時間単位でずれるだけなので、UTC の時間区切りをそのまま使える
+        await self.flush()
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT CAST(created_at / 3600 AS INTEGER) * 3600 AS hour_start, COUNT(*) FROM messages "
+            "WHERE channel_id = ? AND created_at >= ? AND created_at < ? GROUP BY hour_start ORDER BY hour_start",
+            (channel_id, start.timestamp(), end.timestamp()),
+        )
+        return {hour_start: count for hour_start, count in rows}
+
+    async def hourly_summaries(self, channel_id: int, start: datetime, end: datetime) -> dict:
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT hour_start, message_count, summary FROM hourly_summaries "
+            "WHERE channel_id = ? AND hour_start >= ? AND hour_start < ?",
+            (channel_id, start.timestamp(), end.timestamp()),
+        )
+        return {hour_start: (count, summary) for hour_start, count, summary in rows}
+
+    async def save_hourly_summary(self, channel_id: int, hour_start: float, message_count: int, summary: str):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO hourly_summaries VALUES (?, ?, ?, ?)",
+            (channel_id, hour_start, message_count, summary),
+        )
+
+    async def sync_state(self, channel_id: int):
+        rows = await asyncio.to_thread(
+            self._query, "SELECT covered_from, last_message_id FROM channel_sync WHERE channel_id = ?", (channel_id,)
+        )
+        return rows[0] if rows else None
+
+    async def synced_channel_ids(self) -> list:
+        rows = await asyncio.to_thread(self._query, "SELECT channel_id FROM channel_sync")
+        return [row[0] for row in rows]
+
+    async def _store_history(self, history) -> tuple:
+        # (取得件数, 取得したうちいちばん古いメッセージの時刻) を返す
+        count = 0
+        oldest = None
+        async for msg in history:
+            if self.add(msg):
+                await self.flush()
+            count += 1
+            created_at = msg.created_at.timestamp()
+            oldest = created_at if oldest is None else min(oldest, created_at)
+        await self.flush()
+        return count, oldest
+
+    async def backfill_gap(self, channel) -> int:
+        # 停止中に投稿されたメッセージを、最後に保存したメッセージ以降から取り直す
+        # 上限に達したときに新しい側を残すよう、新しい順に取得する
+        state = await self.sync_state(channel.id)
+        if not state or not state[1]:
+            return 0
+        count, oldest = await self._store_history(channel.history(
+            limit=MESSAGE_BACKFILL_LIMIT, after=discord.Object(id=state[1]), oldest_first=False
+        ))
+        if count >= MESSAGE_BACKFILL_LIMIT:
+            # 取れなかった古い側は、揃っている範囲から外して ensure_range で取り直させる
+            print(f"[メッセージログ補完] {channel.id} は上限 {MESSAGE_BACKFILL_LIMIT} 件に達したので、"
+                  f"{datetime.fromtimestamp(oldest, timezone.utc):%Y-%m-%d %H:%M} (UTC) より前は後で取得するよ")
+            await asyncio.to_thread(
+                self._execute,
+                "UPDATE channel_sync SET covered_from = MAX(covered_from, ?) WHERE channel_id = ?",
+                (oldest, channel.id),
+            )
+        return count
+
+    async def ensure_range(self, channel, start: datetime) -> int:
+        # start 以降のログが揃っていなければ、足りない区間だけ Discord から取得する
+        # 新しい順に取得し、上限に達したら実際に取得できたところまでを揃っている範囲とする
+        state = await self.sync_state(channel.id)
+        if state and state[0] <= start.timestamp():
+            return 0
+        before = datetime.fromtimestamp(state[0], timezone.utc) if state else None
+        count, oldest = await self._store_history(channel.history(
+            limit=MESSAGE_BACKFILL_LIMIT, after=start, before=before, oldest_first=False
+        ))
+        covered_from = start.timestamp()
+        if count >= MESSAGE_BACKFILL_LIMIT:
+            covered_from = oldest
+            print(f"[メッセージログ補完] {channel.id} は上限 {MESSAGE_BACKFILL_LIMIT} 件に達したので、"
+                  f"{datetime.fromtimestamp(oldest, timezone.utc):%Y-%m-%d %H:%M} (UTC) より前はまだ欠けているよ")
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO channel_sync (channel_id, covered_from) VALUES (?, ?) "
+            "ON CONFLICT(channel_id) DO UPDATE SET covered_from = MIN(covered_from, excluded.covered_from)",
+            (channel.id, covered_from),
+        )
+        return count
+
+    async def update_content(self, message_id: int, content: str):
+        await self.flush()
+        await asyncio.to_thread(self._execute, "UPDATE messages SET content = ? WHERE id = ?", (content.strip(), message_id))
+
+    async def delete(self, message_id: int):
+        await self.flush()
+        await asyncio.to_thread(self._execute, "DELETE FROM messages WHERE id = ?", (message_id,))
+
+    async def prune(self, days: int = MESSAGE_RETENTION_DAYS):
+        cutoff = datetime.now(timezone.utc).timestamp() - days * 86400
+        await asyncio.to_thread(self._execute, "DELETE FROM messages WHERE created_at < ?", (cutoff,))
+        await asyncio.to_thread(self._execute, "DELETE FROM hourly_summaries WHERE hour_start < ?", (cutoff,))
+        await asyncio.to_thread(
+            self._execute, "UPDATE channel_sync SET covered_from = MAX(covered_from, ?)", (cutoff,)
+        )
+
+message_store = MessageStore(MESSAGE_DB_PATH)
+
+@scheduler.every("flush_message_log", MESSAGE_FLUSH_INTERVAL)
+async def flush_message_log():
+    try:
+        await message_store.flush()
+    except Exception as e:
+        print(f"[メッセージログ書き込みエラー] {e!r}")
+
+@scheduler.every("prune_message_log", 6 * 60 * 60)
+async def prune_message_log():
+    try:
+        await message_store.prune()
+    except Exception as e:
+        print(f"[メッセージログ整理エラー] {e!r}")
+
+async def backfill_message_log():
+    channel_ids = set(await message_store.synced_channel_ids())
+    if CHANNEL_ID:
+        channel_ids.add(CHANNEL_ID)
+    for channel_id in channel_ids:
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            continue
+        try:
+            count = await message_store.backfill_gap(channel)
+            if count:
+                print(f"[DEBUG] {channel_id} のログを {count} 件補完したよ")
+        except Exception as e:
+            print(f"[メッセージログ補完エラー] {channel_id}: {e!r}")
+
+@bot.event
+async def on_raw_message_edit(payload):
+    if payload.data.get("author", {}).get("bot"):
+        return
+    content = payload.data.get("content")
+    if content is not None:
+        await message_store.update_content(payload.message_id, content)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    await message_store.delete(payload.message_id)
+
+# ---------------------
+# チャンネルごとの直近メッセージ（リングバッファ）
+# ---------------------
+RECENT_PER_CHANNEL = int(os.getenv("RECENT_PER_CHANNEL", "20"))
+RECENT_MAX_BYTES = int(os.getenv("RECENT_MAX_BYTES", str(1024 * 1024)))  # 全チャンネル合計の上限
+RECENT_MAX_CONTENT = 500  # 1件あたりに保持する最大文字数
+
+class RecentMessages:
+    def __init__(self, per_channel: int, max_bytes: int):
+        self.per_channel = per_channel
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._channels = OrderedDict()  # チャンネルID -> deque((名前, 本文, 投稿時刻))
+
+    @staticmethod
+    def _size(item) -> int:
+        return len(item[0].encode("utf-8")) + len(item[1].encode("utf-8")) + 64
+
+    def add(self, channel_id: int, author_name: str, content: str, created_at: float):
+        buffer = self._channels.pop(channel_id, None)
+        if buffer is None:
+            buffer = deque(maxlen=self.per_channel)
+        if len(buffer) == buffer.maxlen:
+            self.bytes -= self._size(buffer[0])
+        item = (author_name, content[:RECENT_MAX_CONTENT], created_at)
+        buffer.append(item)
+        self.bytes += self._size(item)
+        self._channels[channel_id] = buffer
+        # 合計サイズを超えたら、いちばん長く発言のないチャンネルから捨てる
+        while self.bytes > self.max_bytes and len(self._channels) > 1:
+            _channel_id, oldest = self._channels.popitem(last=False)
+            self.bytes -= sum(self._size(i) for i in oldest)
+
+    def recent(self, channel_id: int, limit: int = None) -> list:
+        buffer = self._channels.get(channel_id)
+        if not buffer:
+            return []
+        items = list(buffer)
+        return items[-limit:] if limit else items
+
+recent_messages = RecentMessages(RECENT_PER_CHANNEL, RECENT_MAX_BYTES)
+
+@message_handler
+async def record_message(message):
+    # どの機能が応答するかにかかわらず、ログとリングバッファには必ず残す
+    if message_store.add(message):
+        spawn(message_store.flush())
+    if message.content.strip():
+        recent_messages.add(
+            message.channel.id, message.author.display_name, message.content.strip(), message.created_at.timestamp()
+        )
+    return False
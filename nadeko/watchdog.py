@@ -0,0 +1,86 @@
+import os
+import sys
+import time as _time
+import asyncio
+import threading
+import traceback
+from nadeko.metrics import metrics
+from nadeko.scheduler import spawn
+
+# ---------------------
+# イベントループの遅れの監視（止めている処理のスタックを記録する）
+# ---------------------
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "0") == "1"  # 有効にするときだけ 1
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))  # 遅れを測る間隔（秒）
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))  # これ以上止まったらスタックを取る
+LOOP_LAG_LOG_INTERVAL = float(os.getenv("LOOP_LAG_LOG_INTERVAL", "60"))  # スタックを出力する最短の間隔
+LOOP_LAG_STACK_DEPTH = 15
+
+metrics.histogram("nadeko_loop_lag_seconds", "イベントループの遅れ（sleep が予定より遅れて戻った時間）")
+metrics.counter("nadeko_loop_stalls_total", "しきい値を超えてイベントループが止まった回数")
+
+class LoopWatchdog:
+    def __init__(self, interval: float, threshold: float, log_interval: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.log_interval = log_interval
+        self.stalls = 0
+        self.suppressed = 0  # 間隔内で出力を省いたスタックの数
+        self._heartbeat = _time.monotonic()
+        self._loop_thread = None
+        self._last_logged = 0.0
+        self._task = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        # イベントループのスレッドから呼ぶ
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = _time.monotonic()
+        self._task = spawn(self._measure())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def _measure(self):
+        # 眠った時間と実際に戻ってくるまでの時間の差が、その間ループを止めていた時間
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            metrics.observe("nadeko_loop_lag_seconds", max(0.0, loop.time() - expected))
+            self._heartbeat = _time.monotonic()
+
+    def _watch(self):
+        # 別スレッドから心拍を見て、止まっている最中にループのスレッドのスタックを取る
+        stalled_since = None
+        while self.is_running():
+            _time.sleep(min(self.interval, self.threshold) / 2)
+            heartbeat = self._heartbeat
+            lag = _time.monotonic() - heartbeat - self.interval
+            if lag < self.threshold:
+                continue
+            if stalled_since == heartbeat:
+                continue  # 同じ停止は1回だけ数える
+            stalled_since = heartbeat
+            self.stalls += 1
+            metrics.inc("nadeko_loop_stalls_total")
+            self._report(lag)
+
+    def _report(self, lag: float):
+        now = _time.monotonic()
+        if now - self._last_logged < self.log_interval:
+            self.suppressed += 1
+            return
+        self._last_logged = now
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame, limit=LOOP_LAG_STACK_DEPTH)) if frame else "（スタックを取れなかった）\n"
+        suppressed = f"（前回から {self.suppressed} 件省略）" if self.suppressed else ""
+        self.suppressed = 0
+        print(f"[イベントループ停止] {lag:.2f}秒以上止まっている{suppressed}\n{stack}", end="")
+
+loop_watchdog = LoopWatchdog(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD, LOOP_LAG_LOG_INTERVAL)
+
+def start_loop_watchdog():
+    if LOOP_WATCHDOG and not loop_watchdog.is_running():
+        loop_watchdog.start()
+        print("[DEBUG] loop watchdog started.")